@@ -1,44 +1,23 @@
 import os
-import json
+import queue
 import threading
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
 
 from config import load_config, save_config, detect_google_drive, detect_default_ppsspp, validate_ppsspp_path, detect_default_pcsx2, validate_pcsx2_path, detect_default_citra, validate_citra_path
-from backup import backup_ppsspp, backup_pcsx2, backup_citra, backup_custom_dir
-from restore import restore_ppsspp, restore_pcsx2, restore_citra, restore_custom_dir
 from extra_backups import load_extra_backups, save_extra_backups
+from runner import backup_jobs, restore_jobs, restore_units, run_units
+from restore import list_backup_entries, restore_options, pending_undo, undo_last_restore, DEFAULT_MAX_DAYS
+from i18n import load_language, get_language, t, tr
+import instrumentation
+from utils import format_size, format_eta
 
 # Fontes padrão
 FONT_DEFAULT = ("Segoe UI", 14)        # Para labels e entradas
 FONT_BOLD = ("Segoe UI", 16, "bold")   # Para títulos e botões
 
-# ====================== Variáveis globais ======================
-translations = {}       # dicionário que vai guardar o idioma atual
-current_language = "EN" # idioma padrão
-
-# ===== Função para carregar idioma =====
-def load_language(lang_code):
-    """Carrega idioma e atualiza variável global"""
-    global translations, current_language
-    current_language = lang_code
-    path = os.path.join("locales", f"{lang_code}.json")
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            translations = json.load(f)
-    except FileNotFoundError:
-        translations = {}  # fallback
-
-# ===== Função t() para pegar tradução =====
-def t(key, *args):
-    """Retorna o texto traduzido, usa key como fallback se não existir"""
-    text = translations.get(key, key)
-    if args:
-        try:
-            text = text.format(*args)
-        except:
-            pass
-    return text
+# Intervalo (ms) em que a interface aplica as atualizações vindas das threads
+UI_POLL_MS = 50
 
 # ====================== CONFIGURAÇÕES DE COR ======================
 COLORS = {
@@ -117,6 +96,132 @@ class CTkNameDialog(ctk.CTkToplevel):
         self.result = None
         self.destroy()
 
+class SelectiveRestoreDialog(ctk.CTkToplevel):
+    """
+    Lista as entradas (jogos) do último backup de uma unidade e restaura só as escolhidas.
+    A lista é lida numa thread (num tar.* isso descompacta o arquivo inteiro) e
+    volta para a interface por call_in_ui.
+    """
+    def __init__(self, parent, units, sync_dir, on_confirm, call_in_ui):
+        super().__init__(parent)
+        self.title(t("selective_restore_window"))
+        self.geometry("480x440")
+        self.resizable(False, True)
+        self.transient(parent)
+        self.grab_set()
+
+        # rótulo → (prefixo, função de restauração, args)
+        self.units = {label: (unit, func, args) for label, unit, func, args in units}
+        self.sync_dir = sync_dir
+        self.on_confirm = on_confirm
+        self.call_in_ui = call_in_ui
+        self.check_vars = []
+        # Leitura em andamento; a resposta de uma unidade já trocada é descartada
+        self.loading = None
+
+        # ===== Escolha da unidade =====
+        top = ctk.CTkFrame(self, fg_color="transparent")
+        top.pack(fill="x", padx=15, pady=(15, 5))
+        ctk.CTkLabel(top, text=t("select_unit"), font=FONT_DEFAULT).pack(side="left")
+
+        labels = list(self.units)
+        self.unit_var = ctk.StringVar(value=labels[0])
+        ctk.CTkOptionMenu(
+            top,
+            values=labels,
+            variable=self.unit_var,
+            command=self.load_entries
+        ).pack(side="left", fill="x", expand=True, padx=(10, 0))
+
+        self.backup_label = ctk.CTkLabel(self, text="", anchor="w", font=("Segoe UI", 12), text_color="#AAAAAA")
+        self.backup_label.pack(fill="x", padx=15)
+
+        # ===== Entradas do backup =====
+        self.list_frame = ctk.CTkScrollableFrame(self)
+        self.list_frame.pack(fill="both", expand=True, padx=15, pady=5)
+
+        btn_frame = ctk.CTkFrame(self, fg_color="transparent")
+        btn_frame.pack(fill="x", padx=15, pady=(5, 15))
+
+        ctk.CTkButton(
+            btn_frame,
+            text=t("cancel"),
+            font=("Segoe UI", 16, "bold"),
+            command=self.destroy
+        ).pack(side="left", expand=True, padx=(0, 5))
+
+        ctk.CTkButton(
+            btn_frame,
+            text=t("restore_selected"),
+            font=("Segoe UI", 16, "bold"),
+            fg_color=COLORS["on"],
+            hover_color=COLORS["on_hover"],
+            command=self.confirm
+        ).pack(side="left", expand=True, padx=(5, 0))
+
+        self.bind("<Escape>", lambda e: self.destroy())
+
+        self.load_entries(self.unit_var.get())
+
+        # Centralizar
+        parent.update_idletasks()
+        x = parent.winfo_x() + (parent.winfo_width() // 2) - 240
+        y = parent.winfo_y() + (parent.winfo_height() // 2) - 220
+        self.geometry(f"+{x}+{y}")
+
+    def load_entries(self, label):
+        for widget in self.list_frame.winfo_children():
+            widget.destroy()
+        self.check_vars = []
+
+        self.loading = label
+        self.backup_label.configure(text=t("loading_entries"))
+        threading.Thread(target=self.read_entries, args=(label,), daemon=True).start()
+
+    def read_entries(self, label):
+        unit = self.units[label][0]
+        try:
+            # Zip: só o diretório central; snapshot: o manifesto; tar.*: o arquivo todo
+            result = list_backup_entries(self.sync_dir, unit)
+        except Exception as e:
+            result = e
+        self.call_in_ui(self.show_entries, label, result)
+
+    def show_entries(self, label, result):
+        if label != self.loading or not self.winfo_exists():
+            return
+        self.loading = None
+        if isinstance(result, Exception):
+            self.backup_label.configure(text=tr("error_extracting_detail", detail=result))
+            return
+
+        backup_name, entries = result
+        if not backup_name:
+            self.backup_label.configure(text=tr("no_backup_found", emulator=label))
+            return
+        self.backup_label.configure(text=backup_name)
+
+        for entry, size in entries:
+            var = ctk.BooleanVar(value=False)
+            ctk.CTkCheckBox(
+                self.list_frame,
+                text=f"{entry}  ({format_size(size)})",
+                variable=var,
+                font=FONT_DEFAULT
+            ).pack(anchor="w", pady=2)
+            self.check_vars.append((entry, var))
+
+    def confirm(self):
+        if self.loading:
+            return
+        selected = [entry for entry, var in self.check_vars if var.get()]
+        if not selected:
+            messagebox.showwarning(t("selective_restore_window"), t("nothing_selected"), parent=self)
+            return
+        unit, func, args = self.units[self.unit_var.get()]
+        self.destroy()
+        self.on_confirm(func, args, selected)
+
 class MultiSavedataBackupApp:
     def __init__(self, root):
         self.root = root
@@ -132,6 +237,10 @@ class MultiSavedataBackupApp:
         self.extra_units = []
         self.emulator_units = []
 
+        # Threads de trabalho não mexem nos widgets: enfileiram chamadas que
+        # a thread da interface executa (Tk não é thread-safe)
+        self.ui_queue = queue.Queue()
+
         # ===== Restaurar tamanho e posição da janela =====
         width = self.config.get("window_width", 900)
         height = self.config.get("window_height", 700)
@@ -151,6 +260,7 @@ class MultiSavedataBackupApp:
         self.create_widgets()
         self.load_defaults()
         self.update_emulator_layout()
+        self.root.after(UI_POLL_MS, self.process_ui_queue)
 
     # ====================== CARREGA LISTA DE EXTRAS ======================
     def load_extra_units_from_json(self):
@@ -183,6 +293,8 @@ class MultiSavedataBackupApp:
         """Atualiza todos os textos da interface quando o idioma muda"""
         self.backup_btn.configure(text=t("start_backup"))
         self.restore_btn.configure(text=t("restore_backup"))
+        self.selective_restore_btn.configure(text=t("selective_restore"))
+        self.undo_restore_btn.configure(text=t("undo_restore"))
         self.sync_folder_label.configure(text=t("sync_folder"))
         self.choose_folder_btn.configure(text=t("choose_folder"))
 
@@ -248,7 +360,7 @@ class MultiSavedataBackupApp:
                 languages = ["EN"]
 
             # pega idioma salvo ou default
-            language_var = ctk.StringVar(value=current_language)
+            language_var = ctk.StringVar(value=get_language())
 
             def on_language_change(choice):
                 load_language(choice)
@@ -381,6 +493,24 @@ class MultiSavedataBackupApp:
         )
         self.restore_btn.pack(side="left", expand=True, fill="x", padx=(5,0))
 
+        self.selective_restore_btn = ctk.CTkButton(
+            btn_frame, text=t("selective_restore"),
+            font=("Segoe UI", 14, "bold"),
+            height=55,
+            width=140,
+            command=self.open_selective_restore
+        )
+        self.selective_restore_btn.pack(side="left", padx=(10,0))
+
+        self.undo_restore_btn = ctk.CTkButton(
+            btn_frame, text=t("undo_restore"),
+            font=("Segoe UI", 14, "bold"),
+            height=55,
+            width=140,
+            command=self.start_undo_restore
+        )
+        self.undo_restore_btn.pack(side="left", padx=(10,0))
+
         # ===== Bind eficiente para redimensionamento =====
         self._resize_job = None
         self.emu_frame.bind("<Configure>", self._on_resize)
@@ -504,8 +634,8 @@ class MultiSavedataBackupApp:
     # ====================== LOAD DEFAULTS ======================
     def load_defaults(self):
         self.ppsspp_var.set(self.config.get("ppsspp_path") or detect_default_ppsspp() or "")
-        self.pcsx2_var.set(self.config.get("pcsx2_path" or detect_default_pcsx2 or ""))
-        self.citra_var.set(self.config.get("citra_path" or detect_default_citra or ""))
+        self.pcsx2_var.set(self.config.get("pcsx2_path") or detect_default_pcsx2() or "")
+        self.citra_var.set(self.config.get("citra_path") or detect_default_citra() or "")
         self.backup_var.set(self.config.get("backup_root") or detect_google_drive() or "")
 
     # ====================== CHOOSERS ======================
@@ -556,92 +686,135 @@ class MultiSavedataBackupApp:
 
     # ====================== BACKUP/RESTORE ======================
     def start_backup(self):
-        self.progress_var.set(0)
-        self.progress_label.configure(text="0%")
+        self.show_progress(0)
         threading.Thread(target=self.run_backup, daemon=True).start()
 
     def start_restore(self):
-        self.progress_var.set(0)
-        self.progress_label.configure(text="0%")
+        self.show_progress(0)
         threading.Thread(target=self.run_restore, daemon=True).start()
 
-    def progress_callback(self, percent, message=None):
-        self.progress_var.set(percent)
-        self.progress_label.configure(text=f"{int(percent)}%")
+    def call_in_ui(self, func, *args):
+        """Agenda func(*args) na thread da interface (seguro de qualquer thread)."""
+        self.ui_queue.put((func, args))
 
-    def run_backup(self):
-        backup_root = self.backup_var.get()
-        messages = []
-        
-        # PPSSPP
-        if self.ppsspp_enabled.get():
-            success, msg = backup_ppsspp(self.ppsspp_var.get(), backup_root, progress_callback=self.progress_callback)
-            messages.append(msg)
-            
-        # PCSX2
-        if self.pcsx2_enabled.get():
-            success, msg = backup_pcsx2(self.pcsx2_var.get(), backup_root, progress_callback=self.progress_callback)
-            messages.append(msg)
-            
-        # CITRA
-        if self.citra_enabled.get():
-            success, msg = backup_citra(self.citra_var.get(), backup_root, progress_callback=self.progress_callback)
-            messages.append(msg)
-
-        # ================== BACKUPS EXTRAS ==================
-        extras = self.extra_data.get("extras", [])
+    def process_ui_queue(self):
+        try:
+            while True:
+                func, args = self.ui_queue.get_nowait()
+                func(*args)
+        except queue.Empty:
+            pass
+        self.root.after(UI_POLL_MS, self.process_ui_queue)
+
+    def progress_callback(self, percent, message=None, rate=None, eta=None):
+        # Chamado pelas threads de trabalho (já limitado pelo runner)
+        self.call_in_ui(self.show_progress, percent, rate, eta)
+
+    def show_progress(self, percent, rate=None, eta=None):
+        """Atualiza barra e texto: percentual, vazão e tempo restante."""
+        self.progress_var.set(percent / 100)
+        text = f"{int(percent)}%"
+        if rate:
+            text += f"  |  {format_size(rate)}/s"
+        if eta is not None and percent < 100:
+            text += f"  |  ETA {format_eta(eta)}"
+        self.progress_label.configure(text=text)
+
+    def current_settings(self):
+        """Config atual com os caminhos digitados na interface."""
+        settings = dict(self.config)
+        settings.update({
+            "ppsspp_path": self.ppsspp_var.get(),
+            "pcsx2_path": self.pcsx2_var.get(),
+            "citra_path": self.citra_var.get(),
+            "backup_root": self.backup_var.get(),
+            "ppsspp_enabled": self.ppsspp_enabled.get(),
+            "pcsx2_enabled": self.pcsx2_enabled.get(),
+            "citra_enabled": self.citra_enabled.get(),
+        })
+        return settings
 
-        for extra in extras:
-            if not extra.get("enabled", True):
-                continue
+    def run_backup(self):
+        settings = self.current_settings()
 
-            success, msg = backup_custom_dir(
-                extra,
-                backup_root,
-                progress_callback=self.progress_callback
-            )
-            messages.append(msg)
+        # Emuladores e extras rodam em paralelo, resultados na ordem original
+        jobs = backup_jobs(settings, self.extra_data.get("extras", []))
+        with instrumentation.run("backup", log=settings.get("run_log", True), profile=settings.get("profile", False)):
+            results = run_units(jobs, settings.get("max_workers"), progress_callback=self.progress_callback)
+        messages = [msg for success, msg in results]
 
-        self.progress_var.set(100)
-        self.progress_label.configure(text="100%")
-        self.show_backup_messages(t("backup_finished"), messages)
+        self.call_in_ui(self.show_progress, 100)
+        self.call_in_ui(self.show_backup_messages, t("backup_finished"), messages)
 
     def run_restore(self):
-        backup_root = self.backup_var.get()
-        messages = []
-
-        # PPSSPP
-        if self.ppsspp_enabled.get():
-            success, msg = restore_ppsspp(self.ppsspp_var.get(), backup_root, progress_callback=self.progress_callback)
-            messages.append(msg)
-            
-        # PCSX2
-        if self.pcsx2_enabled.get():
-            success, msg = restore_pcsx2(self.pcsx2_var.get(), backup_root, progress_callback=self.progress_callback)
-            messages.append(msg)
-            
-        # CITRA
-        if self.citra_enabled.get():
-            success, msg = restore_citra(self.citra_var.get(), backup_root, progress_callback=self.progress_callback)
-            messages.append(msg)
-
-        # ================== RESTORES EXTRAS ==================
-        extras = self.extra_data.get("extras", [])
-
-        for extra in extras:
-            if not extra.get("enabled", True):
-                continue
-
-            success, msg = restore_custom_dir(
-                extra,
-                backup_root,
-                progress_callback=self.progress_callback
-            )
-            messages.append(msg)
-
-        self.progress_var.set(100)
-        self.progress_label.configure(text="100%")
-        messagebox.showinfo(t("restore_finished"), "\n\n".join(messages))
+        settings = self.current_settings()
+
+        # Enquanto uma unidade ainda copia o backup da pasta sincronizada,
+        # outra já está extraindo
+        jobs = restore_jobs(settings, self.extra_data.get("extras", []))
+        with instrumentation.run("restore", log=settings.get("run_log", True), profile=settings.get("profile", False)):
+            results = run_units(jobs, settings.get("max_workers"), progress_callback=self.progress_callback)
+        messages = [msg for success, msg in results]
+
+        self.call_in_ui(self.show_progress, 100)
+        self.call_in_ui(messagebox.showinfo, t("restore_finished"), "\n\n".join(messages))
+
+    # ================== RESTAURAÇÃO SELETIVA ==================
+    def open_selective_restore(self):
+        settings = self.current_settings()
+        units = restore_units(settings, self.extra_data.get("extras", []))
+        if not units:
+            messagebox.showwarning(t("selective_restore_window"), t("no_units_enabled"))
+            return
+        SelectiveRestoreDialog(self.root, units, settings.get("backup_root"), self.start_selective_restore,
+                               self.call_in_ui)
+
+    def start_selective_restore(self, func, args, members):
+        self.show_progress(0)
+        kwargs = dict(restore_options(self.current_settings()), members=members)
+        threading.Thread(target=self.run_selective_restore, args=(func, args, kwargs), daemon=True).start()
+
+    def run_selective_restore(self, func, args, kwargs):
+        # Passa pelo runner para ganhar a mesma barra com vazão/ETA
+        [(success, msg)] = run_units([(func, args, kwargs)], 1, progress_callback=self.progress_callback)
+        self.call_in_ui(self.show_progress, 100)
+        self.call_in_ui(messagebox.showinfo, t("restore_finished"), msg)
+
+    # ================== DESFAZER RESTAURAÇÃO ==================
+    def start_undo_restore(self):
+        max_days = self.current_settings().get("restore_rollback_days", DEFAULT_MAX_DAYS)
+        threading.Thread(target=self.check_undo_restore, args=(max_days,), daemon=True).start()
+
+    def check_undo_restore(self, max_days):
+        # Conferir se as pastas mudaram lê o disco: fora da thread da interface
+        self.call_in_ui(self.confirm_undo_restore, pending_undo(max_days=max_days), max_days)
+
+    def confirm_undo_restore(self, pending, max_days):
+        if not pending:
+            messagebox.showinfo(t("undo_finished"), t("undo_nothing"))
+            return
+        units = restore_units(self.current_settings(), self.extra_data.get("extras", []))
+        labels = {prefix: label for label, prefix, _, _ in units}
+        lines = [t("undo_confirm")]
+        for prefix, entry, changed in pending:
+            lines.append(tr("undo_confirm_unit", name=labels.get(prefix, prefix), backup=entry.get("backup"),
+                            time=entry.get("created", "?").replace("T", " ")))
+            if changed:
+                lines.append(tr("undo_confirm_changed", count=len(changed), files=", ".join(changed[:3])))
+        changed = any(files for _, _, files in pending)
+        if not messagebox.askyesno(t("undo_restore"), "\n".join(lines), icon="warning" if changed else "question"):
+            return
+        # Só as unidades mostradas; o usuário já viu o aviso do que mudou
+        units = {prefix for prefix, _, _ in pending}
+        threading.Thread(target=self.run_undo_restore, args=(units, max_days), daemon=True).start()
+
+    def run_undo_restore(self, units, max_days):
+        # Devolve cada pasta ao ponto de retorno guardado antes da restauração
+        results = undo_last_restore(units, force=True, max_days=max_days)
+        if not results:
+            self.call_in_ui(messagebox.showinfo, t("undo_finished"), t("undo_nothing"))
+            return
+        self.call_in_ui(messagebox.showinfo, t("undo_finished"), "\n\n".join(msg for _, _, msg in results))
 
     # ================== BACKUP MESSAGES ==================        
     def show_backup_messages(self, title, messages):
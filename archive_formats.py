@@ -0,0 +1,260 @@
+import io
+import os
+import bz2
+import gzip
+import lzma
+import shutil
+import tarfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from archiver import (
+    create_zip, extract_zip, list_zip_groups, iter_tree, group_of, is_selected, is_metadata,
+    new_hash, manifest_data, copy_if_changed, _HashingWriter, _member_target, EXTRACT_BUFFER, MANIFEST_MEMBER,
+)
+from publish import publishing
+
+# ===================== FORMATOS DE ARQUIVO =====================
+# Além do zip, os backups podem ser tar compactado com gzip, xz ou bzip2
+# (tudo da biblioteca padrão). O formato é escolhido por unidade no config
+# ("archive_format") e a restauração descobre o formato pelos primeiros
+# bytes do arquivo, não pelo nome.
+#
+# Nos formatos tar, o fluxo é cortado em blocos de BLOCK_SIZE e cada bloco
+# vira um membro gzip/xz/bzip2 independente, compactado numa thread
+# separada (zlib, lzma e bz2 liberam o GIL). Membros concatenados são um
+# arquivo válido para gzip/xz/bzip2 e para o tarfile, então uma unidade
+# grande usa todos os núcleos.
+
+DEFAULT_FORMAT = "zip"
+
+BLOCK_SIZE = 4 * 1024 * 1024
+
+# Erros de leitura de um backup corrompido ou truncado, em qualquer formato
+ARCHIVE_ERRORS = (OSError, ValueError, EOFError, zipfile.BadZipFile, tarfile.TarError, lzma.LZMAError)
+
+# compress: bloco → membro compactado; open: leitor que aceita vários membros
+# seguidos (o modo fluxo do tarfile só lê o primeiro)
+FORMATS = {
+    "zip": {"suffix": ".zip", "compress": None, "open": None},
+    "tar.gz": {
+        "suffix": ".tar.gz",
+        "compress": lambda block: gzip.compress(block, 6, mtime=0),
+        "open": lambda raw: gzip.GzipFile(fileobj=raw, mode="rb"),
+    },
+    "tar.xz": {
+        "suffix": ".tar.xz",
+        "compress": lambda block: lzma.compress(block, preset=6),
+        "open": lambda raw: lzma.LZMAFile(raw, "rb"),
+    },
+    "tar.bz2": {
+        "suffix": ".tar.bz2",
+        "compress": lambda block: bz2.compress(block, 9),
+        "open": lambda raw: bz2.BZ2File(raw, "rb"),
+    },
+}
+
+# Assinaturas no início do arquivo
+_MAGIC = (
+    (b"PK\x03\x04", "zip"),
+    (b"PK\x05\x06", "zip"),
+    (b"\x1f\x8b", "tar.gz"),
+    (b"\xfd7zXZ\x00", "tar.xz"),
+    (b"BZh", "tar.bz2"),
+)
+
+
+def archive_suffix(fmt):
+    """Extensão do formato; formato desconhecido é erro de configuração."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown archive format: {fmt}")
+    return FORMATS[fmt]["suffix"]
+
+
+def detect_format(path):
+    """Formato de um backup pelos primeiros bytes."""
+    with open(path, "rb") as f:
+        head = f.read(8)
+    for magic, fmt in _MAGIC:
+        if head.startswith(magic):
+            return fmt
+    raise ValueError(f"Unknown archive format: {os.path.basename(path)}")
+
+
+class _BlockCompressor:
+    """
+    Objeto-arquivo só de escrita: junta o que recebe em blocos, compacta
+    cada bloco no pool de threads e grava os resultados em raw na ordem.
+    No máximo 2 blocos por worker ficam em memória ao mesmo tempo.
+    """
+
+    def __init__(self, raw, compress, workers=None, block_size=BLOCK_SIZE):
+        self.raw = raw
+        self.compress = compress
+        self.block_size = block_size
+        workers = workers or os.cpu_count() or 1
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compress")
+        self.max_pending = 2 * workers
+        self.pending = deque()
+        self.buffer = bytearray()
+
+    def _submit(self, block):
+        self.pending.append(self.pool.submit(self.compress, block))
+        while len(self.pending) > self.max_pending:
+            self.raw.write(self.pending.popleft().result())
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            self._submit(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return len(data)
+
+    def close(self):
+        """Compacta o resto e espera todos os blocos."""
+        try:
+            if self.buffer:
+                self._submit(bytes(self.buffer))
+                self.buffer.clear()
+            while self.pending:
+                self.raw.write(self.pending.popleft().result())
+        finally:
+            self.pool.shutdown(wait=True)
+
+
+class _HashingReader:
+    """Repassa a leitura do arquivo calculando o hash do manifesto no caminho."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.hash = new_hash()
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.hash.update(data)
+        return data
+
+
+def _create_tar(source_dir, dest_path, compress, progress_callback=None, workers=None):
+    entries = [
+        (path, arcname, 0 if arcname.endswith("/") else os.path.getsize(path))
+        for path, arcname in iter_tree(source_dir)
+    ]
+    total = sum(size for _, _, size in entries)
+    done = 0
+    hashes = {}
+
+    with publishing(dest_path) as raw:
+        out = _HashingWriter(raw)
+        compressor = _BlockCompressor(out, compress, workers)
+        try:
+            # "w|": fluxo sequencial, o tarfile nunca volta no arquivo
+            with tarfile.open(fileobj=compressor, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+                for path, arcname, size in entries:
+                    info = tar.gettarinfo(path, arcname.rstrip("/"))
+                    if not info.isreg():
+                        tar.addfile(info)
+                    else:
+                        with open(path, "rb") as f:
+                            reader = _HashingReader(f)
+                            tar.addfile(info, reader)
+                        hashes[arcname] = (info.size, reader.hash.hexdigest())
+                    done += size
+                    if progress_callback:
+                        progress_callback(done, total)
+
+                data = manifest_data(hashes)
+                info = tarfile.TarInfo(MANIFEST_MEMBER)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                tar.addfile(info, io.BytesIO(data))
+        finally:
+            compressor.close()
+
+    return out.size, out.hash.hexdigest()
+
+
+def create_archive(source_dir, dest_path, fmt=DEFAULT_FORMAT, progress_callback=None, adaptive=True, workers=None):
+    """
+    Compacta source_dir em dest_path no formato pedido, usando até `workers`
+    threads de compressão (padrão: número de núcleos).
+    Retorna (tamanho, sha256) do arquivo gerado.
+    """
+    archive_suffix(fmt)
+    if fmt == "zip":
+        return create_zip(source_dir, dest_path, progress_callback=progress_callback, adaptive=adaptive, workers=workers)
+    return _create_tar(source_dir, dest_path, FORMATS[fmt]["compress"], progress_callback, workers)
+
+
+def list_archive_groups(path, depth=1):
+    """Entradas do backup agrupadas até `depth` níveis: [(entrada, bytes)]."""
+    fmt = detect_format(path)
+    if fmt == "zip":
+        return list_zip_groups(path, depth)
+
+    sizes = {}
+    # tar compactado não tem índice: a lista exige ler o arquivo inteiro
+    with open(path, "rb", buffering=EXTRACT_BUFFER) as raw, FORMATS[fmt]["open"](raw) as stream, \
+            tarfile.open(fileobj=stream, mode="r|") as tar:
+        for info in tar:
+            if is_metadata(info.name):
+                continue
+            group = group_of(info.name, depth)
+            sizes[group] = sizes.get(group, 0) + (info.size if info.isfile() else 0)
+    return sorted(sizes.items())
+
+
+def _extract_tar(path, fmt, dest_dir, progress_callback=None, members=None, stats=None):
+    """
+    Extrai numa única passada ("r|"): tar compactado não tem índice e voltar
+    no fluxo obrigaria a descompactar de novo. Sem o total descompactado de
+    antemão, o progresso é a posição no arquivo compactado.
+    Com stats.compare, cada membro é comparado com o arquivo local durante a
+    leitura (o manifesto só vem no fim do fluxo) e só é gravado se diferir.
+    """
+    dest_root = os.path.abspath(dest_dir)
+    total = os.path.getsize(path)
+    count = 0
+    with open(path, "rb", buffering=EXTRACT_BUFFER) as raw, FORMATS[fmt]["open"](raw) as stream, \
+            tarfile.open(fileobj=stream, mode="r|") as tar:
+        for info in tar:
+            if not is_selected(info.name, members) or not (info.isfile() or info.isdir()) or is_metadata(info.name):
+                continue
+            target = _member_target(dest_root, info.name)
+            count += 1
+            if info.isdir():
+                os.makedirs(target, exist_ok=True)
+                continue
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with tar.extractfile(info) as src:
+                if stats and stats.compare:
+                    written = copy_if_changed(src, target, info.size)
+                else:
+                    with publishing(target, durable=False) as dst:
+                        shutil.copyfileobj(src, dst, EXTRACT_BUFFER)
+                    written = True
+            if written:
+                os.utime(target, (info.mtime, info.mtime))
+            if stats:
+                stats.add(info.size, written)
+
+            if progress_callback:
+                progress_callback(raw.tell(), total)
+
+    return count
+
+
+def extract_archive(path, dest_dir, progress_callback=None, members=None, stats=None):
+    """
+    Extrai um backup zip ou tar.* (detectado pelo conteúdo) para dest_dir.
+    Só arquivos e pastas são extraídos; links e dispositivos no tar são
+    ignorados. stats (ExtractStats) pula o que já está igual no disco.
+    Retorna a quantidade de membros extraídos.
+    """
+    fmt = detect_format(path)
+    if fmt == "zip":
+        return extract_zip(path, dest_dir, progress_callback=progress_callback, members=members, stats=stats)
+    return _extract_tar(path, fmt, dest_dir, progress_callback, members, stats)
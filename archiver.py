@@ -0,0 +1,508 @@
+import os
+import json
+import stat
+import time
+import zlib
+import shutil
+import zipfile
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from publish import publishing, is_partial
+from rollback import ROLLBACK_DIR
+
+# ===================== ARQUIVADOR ZIP EMBUTIDO =====================
+
+# Membros internos do programa (assinaturas, dados de delta...) começam com
+# este prefixo: nunca são extraídos nem aparecem na restauração seletiva.
+METADATA_PREFIX = ".msb_"
+
+
+def is_metadata(arcname):
+    return arcname.startswith(METADATA_PREFIX)
+
+
+# ===================== MANIFESTO DE HASHES =====================
+# Todo backup leva um manifesto com o BLAKE2b de cada arquivo, calculado na
+# mesma leitura que alimenta o compressor (sem segunda passada pelos saves).
+# verify.py confere o backup contra ele sem extrair nada.
+
+MANIFEST_MEMBER = METADATA_PREFIX + "manifest.json"
+MANIFEST_ALGORITHM = "blake2b"
+
+# Tamanho dos pedaços lidos ao copiar um arquivo para dentro do backup
+COPY_BUFFER = 1024 * 1024
+
+
+def new_hash():
+    return hashlib.blake2b()
+
+
+def manifest_data(hashes):
+    """Conteúdo do manifesto a partir de {nome: (tamanho, hash)}."""
+    return json.dumps({
+        "version": 1,
+        "algorithm": MANIFEST_ALGORITHM,
+        "files": {name: {"size": size, "hash": digest} for name, (size, digest) in sorted(hashes.items())},
+    }).encode("utf-8")
+
+
+def write_hashed(zf, path, arcname, compress_type, compresslevel=None):
+    """Como zf.write para um arquivo, mas devolve o BLAKE2b do que foi lido."""
+    zinfo = zipfile.ZipInfo.from_file(path, arcname)
+    zinfo.compress_type = compress_type
+    zinfo._compresslevel = compresslevel
+    digest = new_hash()
+    with open(path, "rb") as src, zf.open(zinfo, "w") as dst:
+        while True:
+            chunk = src.read(COPY_BUFFER)
+            if not chunk:
+                break
+            digest.update(chunk)
+            dst.write(chunk)
+    return zinfo.file_size, digest.hexdigest()
+
+
+def iter_tree(root):
+    """
+    Percorre a pasta em ordem estável e devolve (caminho, nome_no_zip).
+    Pastas vazias também entram, para que a restauração recrie a estrutura.
+    Ficam de fora os pontos de retorno (.msb_rollback de outra unidade cujo
+    destino fica dentro de root) e os parciais de uma gravação em andamento.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames if name != ROLLBACK_DIR)
+        filenames = sorted(name for name in filenames if not is_partial(name))
+        if dirpath != root and not dirnames and not filenames:
+            rel = os.path.relpath(dirpath, root).replace(os.sep, "/")
+            yield dirpath, rel + "/"
+            continue
+        for name in filenames:
+            full = os.path.join(dirpath, name)
+            yield full, os.path.relpath(full, root).replace(os.sep, "/")
+
+
+class _HashingWriter:
+    """
+    Repassa a escrita para o arquivo real calculando o SHA-256 no caminho.
+    Sem tell()/seek(), o zipfile grava em modo streaming (data descriptors)
+    e nunca volta no arquivo, então o hash sai numa única passada.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.hash.update(data)
+        self.size += len(data)
+        return self.raw.write(data)
+
+    def flush(self):
+        self.raw.flush()
+
+
+# ===================== COMPRESSÃO ADAPTATIVA =====================
+# Saves de jogos misturam dados muito compressíveis (cartões de memória quase
+# vazios) com blobs já compactados ou criptografados (ícones, extdata do 3DS).
+# Deflate nesses últimos gasta CPU e não reduz nada, então cada arquivo é
+# avaliado antes: pela extensão e, se ela não decidir, compactando o primeiro
+# bloco no nível mais rápido.
+
+# Extensões que já vêm compactadas: vão direto como STORED
+COMPRESSED_EXTENSIONS = {
+    ".zip", ".7z", ".rar", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".lz4", ".cab",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".mp3", ".ogg", ".opus", ".m4a",
+    ".mp4", ".mkv", ".webm", ".avi", ".cso", ".chd", ".pbp",
+}
+
+SAMPLE_SIZE = 64 * 1024
+# Arquivos menores que isso são compactados sem teste (o teste custaria mais)
+SAMPLE_MIN_SIZE = 4 * 1024
+# Razão comprimido/original da amostra acima da qual o arquivo é guardado sem
+# compressão, e acima da qual vale só o nível mais rápido
+STORE_RATIO = 0.95
+FAST_RATIO = 0.80
+
+
+def choose_compression(path, size, compresslevel=6):
+    """Retorna (compress_type, compresslevel) para o arquivo."""
+    if os.path.splitext(path)[1].lower() in COMPRESSED_EXTENSIONS:
+        return zipfile.ZIP_STORED, None
+    if size < SAMPLE_MIN_SIZE:
+        return zipfile.ZIP_DEFLATED, compresslevel
+
+    with open(path, "rb") as f:
+        sample = f.read(SAMPLE_SIZE)
+    if not sample:
+        return zipfile.ZIP_DEFLATED, compresslevel
+    ratio = len(zlib.compress(sample, 1)) / len(sample)
+    if ratio > STORE_RATIO:
+        return zipfile.ZIP_STORED, None
+    if ratio > FAST_RATIO:
+        return zipfile.ZIP_DEFLATED, 1
+    return zipfile.ZIP_DEFLATED, compresslevel
+
+
+# ===================== DEFLATE EM PARALELO =====================
+# Cada arquivo é cortado em blocos de DEFLATE_BLOCK e cada bloco é
+# compactado numa thread do pool (zlib libera o GIL) com um compressor
+# próprio: os blocos terminam em Z_SYNC_FLUSH (o último em Z_FINISH), então
+# a concatenação deles é um fluxo deflate válido (mesma ideia do pigz). Só a
+# thread que chamou create_zip grava no zip, na ordem dos arquivos.
+
+DEFLATE_BLOCK = 1024 * 1024
+
+
+def _deflate_block(path, offset, length, level, last):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return data, compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class _PrecompressedSink:
+    """Compressor nulo do zipfile: os dados já chegam compactados."""
+
+    def flush(self):
+        return b""
+
+
+class _ParallelDeflater:
+    """
+    Fila ordenada de membros DEFLATED para um ZipFile aberto. Cabeçalho,
+    data descriptor e diretório central continuam sendo do zipfile; só os
+    dados compactados entram por fora. No máximo 2 blocos por worker ficam
+    em memória.
+    """
+
+    def __init__(self, zf, workers=None, on_bytes=None):
+        self.zf = zf
+        self.on_bytes = on_bytes
+        workers = workers or os.cpu_count() or 1
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="deflate")
+        self.window = 2 * workers
+        self.queue = deque()
+        self.in_flight = 0
+        self.hashes = {}
+        self.handle = None
+
+    def add(self, path, arcname, size, level):
+        zinfo = zipfile.ZipInfo.from_file(path, arcname)
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        self.queue.append(("start", zinfo))
+
+        offset = 0
+        while True:
+            length = min(DEFLATE_BLOCK, size - offset)
+            last = offset + length >= size
+            while self.in_flight >= self.window:
+                self._write_next()
+            self.queue.append(("block", self.pool.submit(_deflate_block, path, offset, length, level, last)))
+            self.in_flight += 1
+            offset += length
+            if last:
+                break
+        self.queue.append(("end", None))
+
+    def _write_next(self):
+        """Grava a fila até escrever um bloco (ou esvaziar)."""
+        while self.queue:
+            kind, item = self.queue.popleft()
+            if kind == "start":
+                self.handle = self.zf._open_to_write(item)
+                self.handle._compressor = _PrecompressedSink()
+                self.digest = new_hash()
+            elif kind == "end":
+                self.hashes[self.handle._zinfo.filename] = (self.handle._file_size, self.digest.hexdigest())
+                # Grava o data descriptor e registra o membro no zipfile
+                self.handle.close()
+                self.handle = None
+            else:
+                data, compressed = item.result()
+                self.in_flight -= 1
+                handle = self.handle
+                handle._crc = zlib.crc32(data, handle._crc)
+                self.digest.update(data)
+                handle._file_size += len(data)
+                handle._compress_size += len(compressed)
+                handle._fileobj.write(compressed)
+                if self.on_bytes:
+                    self.on_bytes(len(data))
+                return
+
+    def flush(self):
+        while self.queue:
+            self._write_next()
+
+    def abort(self):
+        """
+        Depois de um erro (save travado ou apagado no meio da leitura): descarta
+        a fila e fecha o membro aberto, senão o ZipFile recusa fechar e o erro
+        original fica escondido atrás de "open writing handle". O zip inteiro
+        é descartado pelo publishing().
+        """
+        for kind, item in self.queue:
+            if kind == "block":
+                item.cancel()
+        self.queue.clear()
+        if self.handle is not None:
+            handle, self.handle = self.handle, None
+            try:
+                handle.close()
+            except Exception:
+                pass
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def create_zip(source_dir, dest_path, progress_callback=None, compresslevel=6, adaptive=True, workers=None,
+               extra_members=None):
+    """
+    Compacta o conteúdo de source_dir direto em dest_path, sem programa externo.
+    O zip é escrito num parcial oculto ao lado do destino e só é renomeado no
+    final (ver publish.py), então o conteúdo nunca é gravado duas vezes em
+    disco e ninguém vê o zip pela metade.
+    Com adaptive, cada arquivo é guardado sem compressão ou com nível menor
+    quando compactar não compensa (ver choose_compression).
+    Os membros DEFLATED são compactados em paralelo por `workers` threads
+    (padrão: número de núcleos).
+    O BLAKE2b de cada arquivo é calculado durante a compressão e vai no
+    manifesto (MANIFEST_MEMBER), gravado no fim.
+    extra_members(infos) recebe {nome: ZipInfo} do que foi gravado e devolve
+    {nome: bytes} de membros de metadados acrescentados no fim.
+    progress_callback(bytes_feitos, bytes_totais) é chamado a cada bloco.
+    Retorna (tamanho, sha256) do zip gerado.
+    """
+    entries = [
+        (path, arcname, 0 if arcname.endswith("/") else os.path.getsize(path))
+        for path, arcname in iter_tree(source_dir)
+    ]
+    total = sum(size for _, _, size in entries)
+    done = 0
+
+    def advance(count):
+        nonlocal done
+        done += count
+        if progress_callback:
+            progress_callback(done, total)
+
+    hashes = {}
+    with publishing(dest_path) as raw:
+        out = _HashingWriter(raw)
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED,
+                             allowZip64=True, compresslevel=compresslevel) as zf:
+            deflater = _ParallelDeflater(zf, workers, advance)
+            try:
+                for path, arcname, size in entries:
+                    compress_type, level = zipfile.ZIP_DEFLATED, compresslevel
+                    if adaptive and size:
+                        compress_type, level = choose_compression(path, size, compresslevel)
+                    if size and compress_type == zipfile.ZIP_DEFLATED:
+                        deflater.add(path, arcname, size, level)
+                        continue
+                    # Pastas, arquivos vazios e STORED: direto, depois do que já está na fila
+                    deflater.flush()
+                    if arcname.endswith("/"):
+                        zf.write(path, arcname)
+                    else:
+                        hashes[arcname] = write_hashed(zf, path, arcname, compress_type)
+                    advance(size)
+                deflater.flush()
+            except BaseException:
+                deflater.abort()
+                raise
+            finally:
+                deflater.shutdown()
+            hashes.update(deflater.hashes)
+            zf.writestr(MANIFEST_MEMBER, manifest_data(hashes))
+            if extra_members:
+                for name, data in extra_members(dict(zf.NameToInfo)).items():
+                    zf.writestr(name, data)
+
+    return out.size, out.hash.hexdigest()
+
+
+# Tamanho do buffer de leitura/escrita ao extrair
+EXTRACT_BUFFER = 1024 * 1024
+
+
+def _member_target(dest_root, arcname):
+    """Caminho de destino do membro, recusando nomes que saiam de dest_root."""
+    target = os.path.abspath(os.path.join(dest_root, arcname))
+    if os.path.commonpath([dest_root, target]) != dest_root:
+        raise ValueError(f"Invalid path in archive: {arcname}")
+    return target
+
+
+# ===================== RESTAURAÇÃO DIFERENCIAL =====================
+# Arquivos que já estão iguais no disco não são regravados (restaurar uma
+# sdmc grande do Citra quase sempre muda pouca coisa). A comparação usa o que
+# cada formato oferece sem descompactar: no zip, tamanho + CRC-32 do
+# diretório central; no repositório, os hashes dos blocos; no delta, o hash
+# do arquivo; no tar, que não tem índice, o fluxo é comparado com o arquivo
+# local enquanto é lido e só é gravado a partir da primeira diferença.
+
+class ExtractStats:
+    """
+    Resultado da restauração: arquivos/bytes gravados e pulados (já iguais).
+    Com compare=False todo arquivo é gravado, só a contagem é feita.
+    """
+
+    def __init__(self, compare=True):
+        self.compare = compare
+        self.written = self.written_bytes = 0
+        self.skipped = self.skipped_bytes = 0
+
+    def add(self, size, written):
+        if written:
+            self.written += 1
+            self.written_bytes += size
+        else:
+            self.skipped += 1
+            self.skipped_bytes += size
+
+
+def local_size(target):
+    """Tamanho do arquivo local, ou None se não existir (ou não for arquivo comum)."""
+    try:
+        st = os.stat(target)
+    except OSError:
+        return None
+    return st.st_size if stat.S_ISREG(st.st_mode) else None
+
+
+def same_crc(target, size, crc):
+    """True se o arquivo local tem esse tamanho e CRC-32 (não lê nada se o tamanho já difere)."""
+    if local_size(target) != size:
+        return False
+    value = 0
+    with open(target, "rb") as f:
+        while True:
+            chunk = f.read(EXTRACT_BUFFER)
+            if not chunk:
+                break
+            value = zlib.crc32(chunk, value)
+    return value == crc
+
+
+def copy_if_changed(src, target, size):
+    """
+    Grava o fluxo src (size bytes) em target só se o conteúdo for diferente
+    do arquivo local; compara em blocos enquanto lê. Retorna True se gravou.
+    """
+    local = open(target, "rb") if local_size(target) == size else None
+    if local is None:
+        with publishing(target, durable=False) as dst:
+            shutil.copyfileobj(src, dst, EXTRACT_BUFFER)
+        return True
+
+    try:
+        matched = 0
+        while True:
+            chunk = src.read(EXTRACT_BUFFER)
+            if not chunk:
+                return False
+            if local.read(len(chunk)) != chunk:
+                break
+            matched += len(chunk)
+
+        # Diferente: o trecho igual vem do disco, o resto do fluxo
+        with publishing(target, durable=False) as dst:
+            local.seek(0)
+            while matched:
+                data = local.read(min(EXTRACT_BUFFER, matched))
+                dst.write(data)
+                matched -= len(data)
+            local.close()
+            dst.write(chunk)
+            shutil.copyfileobj(src, dst, EXTRACT_BUFFER)
+        return True
+    finally:
+        local.close()
+
+
+def group_of(arcname, depth=1):
+    """Primeiros `depth` componentes do caminho (a pasta do jogo do membro)."""
+    return "/".join(arcname.rstrip("/").split("/")[:depth])
+
+
+def is_selected(arcname, groups):
+    """True se o membro pertence a uma das entradas escolhidas (ou se groups é None)."""
+    if groups is None:
+        return True
+    name = arcname.rstrip("/")
+    return any(name == group or name.startswith(group + "/") for group in groups)
+
+
+def list_zip_groups(zip_path, depth=1):
+    """
+    Entradas do zip agrupadas até `depth` níveis: [(entrada, bytes)].
+    Só o diretório central é lido, nenhum dado é descompactado.
+    """
+    sizes = {}
+    with zipfile.ZipFile(zip_path) as zf:
+        for info in zf.infolist():
+            if is_metadata(info.filename):
+                continue
+            group = group_of(info.filename, depth)
+            sizes[group] = sizes.get(group, 0) + info.file_size
+    return sorted(sizes.items())
+
+
+def extract_member(zf, info, dest_root, stats=None):
+    """
+    Extrai um membro do zip aberto para dentro de dest_root (caminho absoluto).
+    Com stats (ExtractStats), um arquivo igual ao do disco é pulado e contado.
+    """
+    target = _member_target(dest_root, info.filename)
+    if info.is_dir():
+        os.makedirs(target, exist_ok=True)
+        return
+
+    if stats and stats.compare and same_crc(target, info.file_size, info.CRC):
+        stats.add(info.file_size, written=False)
+        return
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with zf.open(info) as src, publishing(target, durable=False) as dst:
+        shutil.copyfileobj(src, dst, EXTRACT_BUFFER)
+    mtime = time.mktime(info.date_time + (0, 0, -1))
+    os.utime(target, (mtime, mtime))
+    if stats:
+        stats.add(info.file_size, written=True)
+
+
+def extract_zip(zip_path, dest_dir, progress_callback=None, members=None, stats=None):
+    """
+    Extrai o zip direto do lugar onde está (ex.: pasta sincronizada) para
+    dest_dir, sem cópia temporária: cada membro é lido com buffer grande e
+    gravado no destino.
+    members limita a extração a essas entradas (ver list_zip_groups); o
+    acesso é aleatório, então só os dados escolhidos são lidos.
+    progress_callback(bytes_feitos, bytes_totais) é chamado a cada arquivo.
+    stats (ExtractStats) pula os arquivos que já estão iguais no disco.
+    Retorna a quantidade de membros extraídos.
+    """
+    dest_root = os.path.abspath(dest_dir)
+    with open(zip_path, "rb", buffering=EXTRACT_BUFFER) as raw, zipfile.ZipFile(raw) as zf:
+        members = [
+            info for info in zf.infolist()
+            if is_selected(info.filename, members) and not is_metadata(info.filename)
+        ]
+        total = sum(info.file_size for info in members)
+        done = 0
+
+        for info in members:
+            extract_member(zf, info, dest_root, stats)
+            if info.is_dir():
+                continue
+            done += info.file_size
+            if progress_callback:
+                progress_callback(done, total)
+
+    return len(members)
@@ -1,44 +1,176 @@
 import os
-import subprocess
-import shutil
+import zipfile
 from datetime import datetime
-from utils import find_compressor
-import json
+from archiver import create_zip
+from archive_formats import create_archive, archive_suffix, DEFAULT_FORMAT
+from delta import create_delta, find_base, signatures_for, DELTA_SUFFIX
+from snapshot_store import create_snapshot, SNAPSHOT_SUFFIX
+from change_tracker import detect_changes, record_backup
+from catalog import add_backup, CATALOG_FILE
+from publish import clean_stale_partials
+from retention import apply_retention
+from instrumentation import phase
+from utils import backup_timestamp, format_size, parse_backup_name
+from i18n import tr
 
-# ===================== CONFIGURAÇÃO DE LOCALE =====================
-def get_translations():
-    """Carrega o idioma atual do config.json e retorna o dicionário de traduções."""
-    language = "EN"  # padrão
+# ===================== FUNÇÕES DE BACKUP =====================
+
+def backup_options(config):
+    """Opções de backup (repassadas às funções backup_*) a partir do config."""
+    return {
+        "repository": config.get("repository_mode", False),
+        "skip_unchanged": config.get("skip_unchanged", True),
+        "hash_check": config.get("change_hash", False),
+        "adaptive": config.get("adaptive_compression", True),
+        "compress_workers": config.get("compress_workers", 0),
+        "archive_format": config.get("archive_format", DEFAULT_FORMAT),
+        "archive_format_units": config.get("archive_format_units"),
+        "delta_units": config.get("delta_units"),
+        "delta_full_every": config.get("delta_full_every", 10),
+        "retention": config.get("retention"),
+        "retention_units": config.get("retention_units"),
+        "retention_dry_run": config.get("retention_dry_run", False),
+    }
+
+
+def backup_dir(sync_dir):
+    """Pasta onde os backups ficam: a sincronizada ou a local "Multi Savedata Backup"."""
+    if sync_dir:
+        return os.path.abspath(sync_dir)
+    return os.path.join(os.getcwd(), "Multi Savedata Backup")
+
+
+def _is_published_name(name):
+    """Arquivos que o backup publica na pasta sincronizada (ver publish.py)."""
+    return name == CATALOG_FILE or parse_backup_name(name) is not None
+
+
+def _prune_old_backups(dest_dir, prefix, policy, dry_run):
+    """Aplica a retenção depois de um backup; retorna o texto a somar na mensagem."""
     try:
-        with open("config.json", "r", encoding="utf-8") as f:
-            config = json.load(f)
-            language = config.get("language", language)
-    except Exception:
-        pass
-
-    translations = {}
-    locale_path = os.path.join("locales", f"{language}.json")
+        deleted, reclaimed = apply_retention(dest_dir, prefix, policy, datetime.now(), dry_run=dry_run)
+    except (OSError, ValueError) as e:
+        return "\n" + tr("retention_error", detail=e)
+    if not deleted:
+        return ""
+    key = "retention_dry_run" if dry_run else "retention_pruned"
+    return "\n" + tr(key, count=len(deleted), size=format_size(reclaimed))
+
+
+def _backup_folder(source_dir, prefix, label, sync_dir, progress,
+                   repository=False, skip_unchanged=False, hash_check=False, adaptive=True, compress_workers=0,
+                   archive_format=DEFAULT_FORMAT, archive_format_units=None, delta_units=None, delta_full_every=10,
+                   retention=None, retention_units=None, retention_dry_run=False):
+    """
+    Compacta source_dir direto no destino final (pasta sincronizada ou a pasta
+    local "Multi Savedata Backup" quando não há sincronização).
+    Com repository=True grava um snapshot deduplicado em vez de um zip.
+    Com skip_unchanged=True a unidade é ignorada se nada mudou desde o
+    último backup (tamanho/mtime, ou hash do conteúdo com hash_check=True).
+    Com adaptive=True arquivos que não compactam bem vão sem compressão.
+    compress_workers limita as threads de compressão (0 = todos os núcleos).
+    O formato do arquivo é archive_format_units[prefix] ou archive_format
+    (zip, tar.gz, tar.xz, tar.bz2).
+    Unidades em delta_units gravam só os blocos que mudaram em relação à
+    última base (zip completo com assinaturas); a cada delta_full_every
+    backups sai uma base nova (ver delta.py).
+    Depois de um backup bem-sucedido aplica a retenção da unidade
+    (retention_units[prefix], ou retention como padrão).
+    """
+    dest_dir = backup_dir(sync_dir)
+    os.makedirs(dest_dir, exist_ok=True)
+
+    timestamp = backup_timestamp()
+
     try:
-        with open(locale_path, "r", encoding="utf-8") as f:
-            translations = json.load(f)
-    except Exception as e:
-        print(f"Não foi possível carregar traduções de {locale_path}: {e}")
-    return translations
+        with phase(prefix, "scan") as record:
+            changed, files_state = detect_changes(prefix, source_dir, dest_dir, with_hash=hash_check)
+            record.files = sum(1 for path in files_state if not path.endswith("/"))
+            record.bytes = sum(state[0] for state in files_state.values())
+        scanned_files, scanned_bytes = record.files, record.bytes
 
-def tr(key, **kwargs):
-    """Retorna a tradução atual da chave, recarregando o idioma se necessário."""
-    translations = get_translations()
-    text = translations.get(key, key)
-    if kwargs:
-        return text.format(**kwargs)
-    return text
+        if skip_unchanged and not changed:
+            progress(100, tr("backup_finished"))
+            return True, tr("no_changes", folder=label.strip())
+
+        progress(30, tr("compacting") + label)
+
+        def on_bytes(done, total):
+            # 30% → 90% proporcional aos bytes já compactados
+            if total:
+                progress(30 + 60 * done / total, done=done, total=total)
+
+        catalog_extra = {}
+        with phase(prefix, "compress") as record:
+            record.files, record.bytes = scanned_files, scanned_bytes
+            base_name = None
+            delta_mode = not repository and prefix in (delta_units or ())
+            if delta_mode:
+                base_name = find_base(dest_dir, prefix, delta_full_every)
+            if repository:
+                backup_name = f"{prefix}_{timestamp}{SNAPSHOT_SUFFIX}"
+                backup_path = os.path.join(dest_dir, backup_name)
+                new_bytes, size, digest = create_snapshot(source_dir, dest_dir, backup_path, progress_callback=on_bytes)
+                record.output_bytes = new_bytes
+                message = tr("snapshot_success", path=backup_path, size=format_size(new_bytes))
+            elif base_name:
+                backup_name = f"{prefix}_{timestamp}{DELTA_SUFFIX}"
+                backup_path = os.path.join(dest_dir, backup_name)
+                size, digest = create_delta(source_dir, backup_path, os.path.join(dest_dir, base_name),
+                                            progress_callback=on_bytes, adaptive=adaptive)
+                record.output_bytes = size
+                catalog_extra["base"] = base_name
+                message = tr("delta_success", path=backup_path, size=format_size(size))
+            elif delta_mode:
+                # Base nova: zip completo com as assinaturas dos arquivos grandes
+                backup_name = f"{prefix}_{timestamp}.zip"
+                backup_path = os.path.join(dest_dir, backup_name)
+                size, digest = create_zip(source_dir, backup_path, progress_callback=on_bytes, adaptive=adaptive,
+                                          workers=compress_workers or None, extra_members=signatures_for(source_dir))
+                record.output_bytes = size
+                if sync_dir:
+                    message = tr("backup_synced_success", path=backup_path)
+                else:
+                    message = tr("backup_success", path=backup_path)
+            else:
+                fmt = (archive_format_units or {}).get(prefix) or archive_format or DEFAULT_FORMAT
+                backup_name = f"{prefix}_{timestamp}{archive_suffix(fmt)}"
+                backup_path = os.path.join(dest_dir, backup_name)
+                size, digest = create_archive(source_dir, backup_path, fmt, progress_callback=on_bytes,
+                                              adaptive=adaptive, workers=compress_workers or None)
+                record.output_bytes = size
+                if sync_dir:
+                    message = tr("backup_synced_success", path=backup_path)
+                else:
+                    message = tr("backup_success", path=backup_path)
+
+        with phase(prefix, "publish"):
+            add_backup(dest_dir, backup_name, size, digest, **catalog_extra)
+            record_backup(prefix, dest_dir, backup_name, files_state)
+
+        with phase(prefix, "cleanup"):
+            policy = (retention_units or {}).get(prefix) or retention
+            message += _prune_old_backups(dest_dir, prefix, policy, retention_dry_run)
+            # Parciais esquecidos por backups que caíram no meio (uma listagem
+            # da pasta por execução, não por unidade)
+            clean_stale_partials(dest_dir, _is_published_name)
 
-# ===================== FUNÇÕES DE BACKUP =====================
+        progress(100, tr("backup_finished"))
+        return True, message
 
-def backup_ppsspp(ppsspp_path, sync_dir=None, progress_callback=None):
-    def progress(percent, message=None):
+    except (OSError, zipfile.LargeZipFile) as e:
+        progress(0, tr("error_compressing"))
+        return False, tr("error_compressing_detail", detail=e)
+    except Exception as e:
+        progress(0, tr("unexpected_error"))
+        return False, tr("unexpected_error_detail", detail=e)
+
+# =======================================================
+
+def backup_ppsspp(ppsspp_path, sync_dir=None, progress_callback=None, **options):
+    def progress(percent, message=None, **counters):
         if progress_callback:
-            progress_callback(percent, message)
+            progress_callback(percent, message, **counters)
 
     savedata = os.path.join(ppsspp_path, "memstick", "PSP", "SAVEDATA")
     if not os.path.isdir(savedata):
@@ -48,53 +180,14 @@ def backup_ppsspp(ppsspp_path, sync_dir=None, progress_callback=None):
     if not os.listdir(savedata):
         return False, tr("folder_empty", folder="SAVEDATA")
 
-    tool, exe = find_compressor()
-    if not exe:
-        return False, tr("compressor_not_found")
-
-    project_root = os.getcwd()
-    local_backup_dir = os.path.join(project_root, "Multi Savedata Backup")
-    os.makedirs(local_backup_dir, exist_ok=True)
-
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    zip_name = f"PPSSPP_SAVES_{timestamp}.zip"
-    local_zip_path = os.path.join(local_backup_dir, zip_name)
-
-    try:
-        progress(30, tr("compacting") + " SAVEDATA")
-        items = [os.path.join(savedata, f) for f in os.listdir(savedata)]
-        if tool == "winrar":
-            cmd = [exe, "a", "-afzip", "-r", local_zip_path] + items
-        else:
-            cmd = [exe, "a", "-tzip", local_zip_path] + items
-        subprocess.run(cmd, check=True)
-
-        if sync_dir:
-            progress(70, tr("syncing_backup"))
-            sync_dir = os.path.abspath(sync_dir)
-            os.makedirs(sync_dir, exist_ok=True)
-            sync_zip_path = os.path.join(sync_dir, zip_name)
-            shutil.copy2(local_zip_path, sync_zip_path)
-            os.remove(local_zip_path)
-            progress(100, tr("backup_finished"))
-            return True, tr("backup_synced_success", path=sync_zip_path)
-
-        progress(100, tr("backup_finished"))
-        return True, tr("backup_success", path=local_zip_path)
-
-    except subprocess.CalledProcessError as e:
-        progress(0, tr("error_compressing"))
-        return False, tr("error_compressing_detail", detail=e)
-    except Exception as e:
-        progress(0, tr("unexpected_error"))
-        return False, tr("unexpected_error_detail", detail=e)
+    return _backup_folder(savedata, "PPSSPP_SAVES", " SAVEDATA", sync_dir, progress, **options)
 
 # =======================================================
 
-def backup_pcsx2(pcsx2_path, sync_dir=None, progress_callback=None):
-    def progress(percent, message=None):
+def backup_pcsx2(pcsx2_path, sync_dir=None, progress_callback=None, **options):
+    def progress(percent, message=None, **counters):
         if progress_callback:
-            progress_callback(percent, message)
+            progress_callback(percent, message, **counters)
 
     memcards = os.path.join(pcsx2_path, "memcards")
     if not os.path.isdir(memcards):
@@ -102,53 +195,14 @@ def backup_pcsx2(pcsx2_path, sync_dir=None, progress_callback=None):
     if not os.listdir(memcards):
         return False, tr("folder_empty", folder="memcards")
 
-    tool, exe = find_compressor()
-    if not exe:
-        return False, tr("compressor_not_found")
-
-    project_root = os.getcwd()
-    local_backup_dir = os.path.join(project_root, "Multi Savedata Backup")
-    os.makedirs(local_backup_dir, exist_ok=True)
-
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    zip_name = f"PCSX2_MEMCARDS_{timestamp}.zip"
-    local_zip_path = os.path.join(local_backup_dir, zip_name)
-
-    try:
-        progress(30, tr("compacting") + " memcards")
-        items = [os.path.join(memcards, f) for f in os.listdir(memcards)]
-        if tool == "winrar":
-            cmd = [exe, "a", "-afzip", "-r", local_zip_path] + items
-        else:
-            cmd = [exe, "a", "-tzip", local_zip_path] + items
-        subprocess.run(cmd, check=True)
-
-        if sync_dir:
-            progress(70, tr("syncing_backup"))
-            sync_dir = os.path.abspath(sync_dir)
-            os.makedirs(sync_dir, exist_ok=True)
-            sync_zip_path = os.path.join(sync_dir, zip_name)
-            shutil.copy2(local_zip_path, sync_zip_path)
-            os.remove(local_zip_path)
-            progress(100, tr("backup_finished"))
-            return True, tr("backup_synced_success", path=sync_zip_path)
-
-        progress(100, tr("backup_finished"))
-        return True, tr("backup_success", path=local_zip_path)
-
-    except subprocess.CalledProcessError as e:
-        progress(0, tr("error_compressing"))
-        return False, tr("error_compressing_detail", detail=e)
-    except Exception as e:
-        progress(0, tr("unexpected_error"))
-        return False, tr("unexpected_error_detail", detail=e)
+    return _backup_folder(memcards, "PCSX2_MEMCARDS", " memcards", sync_dir, progress, **options)
 
 # =======================================================
 
-def backup_citra(citra_path, sync_dir=None, progress_callback=None):
-    def progress(percent, message=None):
+def backup_citra(citra_path, sync_dir=None, progress_callback=None, **options):
+    def progress(percent, message=None, **counters):
         if progress_callback:
-            progress_callback(percent, message)
+            progress_callback(percent, message, **counters)
 
     sdmc = os.path.join(citra_path, "sdmc")
     if not os.path.isdir(sdmc):
@@ -156,53 +210,14 @@ def backup_citra(citra_path, sync_dir=None, progress_callback=None):
     if not os.listdir(sdmc):
         return False, tr("folder_empty", folder="sdmc")
 
-    tool, exe = find_compressor()
-    if not exe:
-        return False, tr("compressor_not_found")
-
-    project_root = os.getcwd()
-    local_backup_dir = os.path.join(project_root, "Multi Savedata Backup")
-    os.makedirs(local_backup_dir, exist_ok=True)
-
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    zip_name = f"CITRA_SDMC_{timestamp}.zip"
-    local_zip_path = os.path.join(local_backup_dir, zip_name)
-
-    try:
-        progress(30, tr("compacting") + " sdmc")
-        items = [os.path.join(sdmc, f) for f in os.listdir(sdmc)]
-        if tool == "winrar":
-            cmd = [exe, "a", "-afzip", "-r", local_zip_path] + items
-        else:
-            cmd = [exe, "a", "-tzip", local_zip_path] + items
-        subprocess.run(cmd, check=True)
-
-        if sync_dir:
-            progress(70, tr("syncing_backup"))
-            sync_dir = os.path.abspath(sync_dir)
-            os.makedirs(sync_dir, exist_ok=True)
-            sync_zip_path = os.path.join(sync_dir, zip_name)
-            shutil.copy2(local_zip_path, sync_zip_path)
-            os.remove(local_zip_path)
-            progress(100, tr("backup_finished"))
-            return True, tr("backup_synced_success", path=sync_zip_path)
-
-        progress(100, tr("backup_finished"))
-        return True, tr("backup_success", path=local_zip_path)
-
-    except subprocess.CalledProcessError as e:
-        progress(0, tr("error_compressing"))
-        return False, tr("error_compressing_detail", detail=e)
-    except Exception as e:
-        progress(0, tr("unexpected_error"))
-        return False, tr("unexpected_error_detail", detail=e)
+    return _backup_folder(sdmc, "CITRA_SDMC", " sdmc", sync_dir, progress, **options)
 
 # =======================================================
 
-def backup_custom_dir(dir_entry, sync_dir=None, progress_callback=None):
-    def progress(percent, message=None):
+def backup_custom_dir(dir_entry, sync_dir=None, progress_callback=None, **options):
+    def progress(percent, message=None, **counters):
         if progress_callback:
-            progress_callback(percent, message)
+            progress_callback(percent, message, **counters)
 
     name = dir_entry.get("name")
     root_path = dir_entry.get("root_path")
@@ -215,44 +230,11 @@ def backup_custom_dir(dir_entry, sync_dir=None, progress_callback=None):
     if not os.listdir(root_path):
         return False, tr("folder_empty", folder=name)
 
-    tool, exe = find_compressor()
-    if not exe:
-        return False, tr("compressor_not_found")
-
-    project_root = os.getcwd()
-    local_backup_dir = os.path.join(project_root, "Multi Savedata Backup")
-    os.makedirs(local_backup_dir, exist_ok=True)
-
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     safe_name = name.replace(" ", "_")
-    zip_name = f"{safe_name}_{timestamp}.zip"
-    local_zip_path = os.path.join(local_backup_dir, zip_name)
-
-    try:
-        progress(30, tr("compacting") + f" '{name}'")
-        items = [os.path.join(root_path, f) for f in os.listdir(root_path)]
-        if tool == "winrar":
-            cmd = [exe, "a", "-afzip", "-r", local_zip_path] + items
-        else:
-            cmd = [exe, "a", "-tzip", local_zip_path] + items
-        subprocess.run(cmd, check=True)
-
-        if sync_dir:
-            progress(70, tr("syncing_backup"))
-            sync_dir = os.path.abspath(sync_dir)
-            os.makedirs(sync_dir, exist_ok=True)
-            sync_zip_path = os.path.join(sync_dir, zip_name)
-            shutil.copy2(local_zip_path, sync_zip_path)
-            os.remove(local_zip_path)
-            progress(100, tr("backup_finished"))
-            return True, tr("backup_synced_success", path=sync_zip_path)
-
-        progress(100, tr("backup_finished"))
-        return True, tr("backup_success", path=local_zip_path)
-
-    except subprocess.CalledProcessError as e:
-        progress(0, tr("error_compressing"))
-        return False, tr("error_compressing_detail", detail=e)
-    except Exception as e:
-        progress(0, tr("unexpected_error"))
-        return False, tr("unexpected_error_detail", detail=e)
+    # Um extra pode ter a própria política de retenção em extra_backups.json
+    if dir_entry.get("retention"):
+        options = dict(options, retention=dir_entry["retention"], retention_units=None)
+    # ...e o próprio formato de arquivo
+    if dir_entry.get("archive_format"):
+        options = dict(options, archive_format=dir_entry["archive_format"], archive_format_units=None)
+    return _backup_folder(root_path, safe_name, f" '{name}'", sync_dir, progress, **options)
@@ -0,0 +1,274 @@
+"""
+Benchmark reprodutível de backup e restauração com árvores de save sintéticas.
+
+Cenários:
+  ppsspp  → PSP/SAVEDATA com centenas de pastas de jogo pequenas
+  pcsx2   → memcards com cartões .ps2 de 8 MB
+  citra   → sdmc com milhares de arquivos pequenos
+  custom  → pasta extra com poucos arquivos grandes (compressível + aleatório)
+
+Cada cenário roda backup_* e restore_* contra uma pasta sincronizada local
+temporária, num processo separado (para medir o pico de RSS de cada um), e o
+resultado vai para um JSON que pode ser comparado entre execuções.
+
+Uso (na raiz do projeto):
+  python benchmarks/bench_backup.py [--scale 1.0] [--only ppsspp,citra]
+                                    [--output bench_results/<data>.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCENARIOS = ("ppsspp", "pcsx2", "citra", "custom")
+SEED = 20260101
+
+
+# ===================== FIXTURES =====================
+
+def _mixed_bytes(rng, size, random_ratio=0.5):
+    """Bytes metade aleatórios (incompressíveis), metade repetitivos."""
+    random_part = int(size * random_ratio)
+    filler = (b"SAVEDATA" * (size // 8 + 1))[:size - random_part]
+    return rng.randbytes(random_part) + filler
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def make_ppsspp(base, rng, scale):
+    root = os.path.join(base, "ppsspp")
+    savedata = os.path.join(root, "memstick", "PSP", "SAVEDATA")
+    for i in range(max(1, int(300 * scale))):
+        game = os.path.join(savedata, f"ULUS{10000 + i}DATA00")
+        _write(os.path.join(game, "PARAM.SFO"), _mixed_bytes(rng, 4096, 0.1))
+        _write(os.path.join(game, "ICON0.PNG"), rng.randbytes(rng.randint(8, 40) * 1024))
+        _write(os.path.join(game, "DATA.BIN"), _mixed_bytes(rng, rng.randint(16, 256) * 1024))
+    return root
+
+
+def make_pcsx2(base, rng, scale):
+    root = os.path.join(base, "pcsx2")
+    memcards = os.path.join(root, "memcards")
+    card_size = 8 * 1024 * 1024
+    for i in range(max(1, int(4 * scale))):
+        # Cartão formatado (0xFF) com alguns clusters de save preenchidos
+        card = bytearray(b"\xff" * card_size)
+        for _ in range(40):
+            offset = rng.randrange(0, card_size - 8192, 1024)
+            card[offset:offset + 8192] = _mixed_bytes(rng, 8192, 0.7)
+        _write(os.path.join(memcards, f"Mcd{i + 1:03d}.ps2"), bytes(card))
+    return root
+
+
+def make_citra(base, rng, scale):
+    root = os.path.join(base, "citra")
+    title_root = os.path.join(root, "sdmc", "Nintendo 3DS", "0" * 32, "1" * 32, "title", "00040000")
+    files = max(1, int(3000 * scale))
+    titles = max(1, files // 30)
+    for i in range(files):
+        title = os.path.join(title_root, f"{0x00030000 + i % titles:08x}", "data", "00000001")
+        _write(os.path.join(title, f"{i:05d}.bin"), _mixed_bytes(rng, rng.randint(2, 16) * 1024, 0.3))
+    return root
+
+
+def make_custom(base, rng, scale):
+    root = os.path.join(base, "custom")
+    big = max(1, int(64 * 1024 * 1024 * scale))
+    _write(os.path.join(root, "profile", "save0.dat"), _mixed_bytes(rng, big, 0.2))
+    _write(os.path.join(root, "profile", "save1.dat"), _mixed_bytes(rng, big, 0.2))
+    _write(os.path.join(root, "cache", "blob.pak"), rng.randbytes(big))
+    for i in range(50):
+        _write(os.path.join(root, "slots", f"slot{i:02d}.sav"), _mixed_bytes(rng, 64 * 1024))
+    return root
+
+
+FIXTURES = {
+    "ppsspp": make_ppsspp,
+    "pcsx2": make_pcsx2,
+    "citra": make_citra,
+    "custom": make_custom,
+}
+
+
+def tree_stats(root):
+    files = 0
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            files += 1
+            size += os.path.getsize(os.path.join(dirpath, name))
+    return files, size
+
+
+# ===================== MEDIÇÃO (processo filho) =====================
+
+def _io_write_bytes():
+    """Bytes gravados pelo processo (Linux); None onde não houver /proc."""
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _peak_rss():
+    """Pico de memória residente do processo em bytes, se disponível."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+    except Exception:
+        return None
+
+
+def _run_operation(scenario, operation, source_root, sync_dir, restore_root):
+    import i18n
+    i18n.LOCALES_DIR = os.path.join(ROOT, "locales")
+    from backup import backup_ppsspp, backup_pcsx2, backup_citra, backup_custom_dir
+    from restore import restore_ppsspp, restore_pcsx2, restore_citra, restore_custom_dir
+
+    extra = {"name": "Bench Custom", "root_path": source_root}
+    if operation == "backup":
+        calls = {
+            "ppsspp": lambda: backup_ppsspp(source_root, sync_dir, skip_unchanged=False),
+            "pcsx2": lambda: backup_pcsx2(source_root, sync_dir, skip_unchanged=False),
+            "citra": lambda: backup_citra(source_root, sync_dir, skip_unchanged=False),
+            "custom": lambda: backup_custom_dir(extra, sync_dir, skip_unchanged=False),
+        }
+    else:
+        extra = dict(extra, root_path=restore_root)
+        os.makedirs(restore_root, exist_ok=True)
+        calls = {
+            "ppsspp": lambda: restore_ppsspp(restore_root, sync_dir),
+            "pcsx2": lambda: restore_pcsx2(restore_root, sync_dir),
+            "citra": lambda: restore_citra(restore_root, sync_dir),
+            "custom": lambda: restore_custom_dir(extra, sync_dir),
+        }
+
+    io_before = _io_write_bytes()
+    start = time.perf_counter()
+    success, msg = calls[scenario]()
+    wall = time.perf_counter() - start
+    io_after = _io_write_bytes()
+
+    return {
+        "success": success,
+        "message": msg,
+        "wall_seconds": wall,
+        "peak_rss_bytes": _peak_rss(),
+        "io_write_bytes": None if io_before is None else io_after - io_before,
+    }
+
+
+# ===================== ORQUESTRAÇÃO =====================
+
+def run_in_child(scenario, operation, source_root, sync_dir, restore_root, workdir):
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--child",
+        scenario, operation, source_root, sync_dir, restore_root,
+    ]
+    # cwd temporário: backup_state.json e afins não sujam o projeto
+    out = subprocess.run(cmd, cwd=workdir, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run_scenario(scenario, base, scale):
+    rng = random.Random(f"{SEED}-{scenario}")
+    source_root = FIXTURES[scenario](os.path.join(base, "src"), rng, scale)
+    source_files, source_bytes = tree_stats(source_root)
+
+    sync_dir = os.path.join(base, "sync", scenario)
+    restore_root = os.path.join(base, "restore", scenario)
+    workdir = os.path.join(base, "work", scenario)
+    for d in (sync_dir, workdir):
+        os.makedirs(d, exist_ok=True)
+
+    if scenario == "ppsspp":
+        os.makedirs(os.path.join(restore_root, "memstick", "PSP"), exist_ok=True)
+    elif scenario == "custom":
+        restore_root = os.path.join(restore_root, "custom")
+
+    result = {"files": source_files, "bytes": source_bytes}
+    for operation in ("backup", "restore"):
+        data = run_in_child(scenario, operation, source_root, sync_dir, restore_root, workdir)
+        data["throughput_mb_s"] = source_bytes / data["wall_seconds"] / 1e6 if data["wall_seconds"] else None
+        result[operation] = data
+
+    result["archive_bytes"] = tree_stats(sync_dir)[1]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de backup/restauração")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplica quantidade/tamanho das fixtures")
+    parser.add_argument("--only", default=",".join(SCENARIOS), help="cenários separados por vírgula")
+    parser.add_argument("--output", help="arquivo JSON de saída (padrão: bench_results/<data>.json)")
+    parser.add_argument("--keep", action="store_true", help="não apaga a pasta temporária")
+    parser.add_argument("--child", nargs=5, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_run_operation(*args.child)))
+        return
+
+    scenarios = [s for s in args.only.split(",") if s in FIXTURES]
+    base = tempfile.mkdtemp(prefix="msb_bench_")
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "cpu_count": os.cpu_count(),
+        "scale": args.scale,
+        "scenarios": {},
+    }
+
+    try:
+        for scenario in scenarios:
+            result = run_scenario(scenario, base, args.scale)
+            report["scenarios"][scenario] = result
+            for operation in ("backup", "restore"):
+                r = result[operation]
+                print(
+                    f"{scenario:<7} {operation:<8} "
+                    f"{'ok ' if r['success'] else 'ERR'} "
+                    f"{r['wall_seconds']:8.2f}s "
+                    f"{(r['throughput_mb_s'] or 0):8.1f} MB/s "
+                    f"rss {(r['peak_rss_bytes'] or 0) / 1e6:7.1f} MB "
+                    f"written {(r['io_write_bytes'] or 0) / 1e6:8.1f} MB"
+                )
+    finally:
+        if not args.keep:
+            shutil.rmtree(base, ignore_errors=True)
+
+    output = args.output or os.path.join(
+        ROOT, "bench_results", datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + ".json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"resultado: {output}")
+
+
+if __name__ == "__main__":
+    main()
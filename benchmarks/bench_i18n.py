@@ -0,0 +1,50 @@
+"""
+Micro-benchmark do tr(): leitura de config.json + locale a cada chamada
+(implementação antiga) contra o cache em memória do i18n.
+
+Uso (na raiz do projeto):  python benchmarks/bench_i18n.py [chamadas]
+"""
+import os
+import sys
+import json
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import i18n
+
+
+def legacy_tr(key, **kwargs):
+    """Cópia do tr() antigo de backup.py/restore.py (sem o cache)."""
+    language = "EN"
+    try:
+        with open("config.json", "r", encoding="utf-8") as f:
+            language = json.load(f).get("language", language)
+    except Exception:
+        pass
+    translations = {}
+    try:
+        with open(os.path.join("locales", f"{language}.json"), "r", encoding="utf-8") as f:
+            translations = json.load(f)
+    except Exception:
+        pass
+    text = translations.get(key, key)
+    return text.format(**kwargs) if kwargs else text
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    results = {}
+    for label, func in (("legacy (file I/O)", legacy_tr), ("i18n (cached)", i18n.tr)):
+        func("backup_success", path="x")  # aquece o cache
+        seconds = min(timeit.repeat(lambda: func("backup_success", path="x"), number=calls, repeat=3))
+        results[label] = seconds / calls * 1e6
+        print(f"{label:<20} {results[label]:10.3f} µs/call")
+
+    legacy, cached = results.values()
+    print(f"speedup: {legacy / cached:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Tempo de importação (partida a frio) dos módulos de entrada, medido com
+`python -X importtime` num processo novo por rodada.
+
+Cada alvo tem um limite em ms; se a mediana passar do limite o script sai
+com código 1, então serve de guarda contra imports pesados no caminho de
+partida (ex.: detecção de pastas no import do config, GUI no CLI).
+
+Uso (na raiz do projeto):
+  python benchmarks/bench_import.py [--runs 7] [--only cli,backup]
+                                    [--budget cli=100] [--output arquivo.json]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Alvo → (imports medidos, limite em ms). O CLI importa o resto só dentro
+# de main(), então o alvo "cli" inclui o que um backup pela linha de comando
+# carrega de fato.
+TARGETS = {
+    "config": ("config", 50),
+    "backup": ("backup", 100),
+    "restore": ("restore", 100),
+    "cli": ("cli, config, extra_backups, runner, instrumentation", 100),
+    "app": ("app", 1500),
+}
+
+
+def parse_importtime(stderr):
+    """
+    Soma o tempo cumulativo (µs) dos imports de primeiro nível (incluindo a
+    partida do interpretador) e devolve (total_us, [(cumulativo_us, módulo)])
+    com os mais caros primeiro.
+    """
+    total = 0
+    top = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Imports aninhados vêm indentados (2 espaços por nível) sob o pai
+        if not name[1:].startswith(" "):
+            us = int(cumulative)
+            total += us
+            top.append((us, name.strip()))
+    top.sort(reverse=True)
+    return total, top
+
+
+def measure(imports, runs):
+    samples = []
+    top = []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {imports}"],
+            cwd=ROOT, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "exit code"
+            return {"error": error}
+        total, top = parse_importtime(proc.stderr)
+        samples.append(total / 1000)
+    return {
+        "median_ms": statistics.median(samples),
+        "min_ms": min(samples),
+        "slowest_imports": [{"module": name, "ms": us / 1000} for us, name in top[:5]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de importação dos módulos de entrada")
+    parser.add_argument("--runs", type=int, default=7, help="processos por módulo (vale a mediana)")
+    parser.add_argument("--only", default=",".join(TARGETS), help="módulos separados por vírgula")
+    parser.add_argument("--budget", action="append", default=[], metavar="MÓDULO=MS",
+                        help="troca o limite de um módulo")
+    parser.add_argument("--output", help="grava o resultado em JSON")
+    args = parser.parse_args()
+
+    budgets = {name: budget for name, (_, budget) in TARGETS.items()}
+    for item in args.budget:
+        name, _, ms = item.partition("=")
+        budgets[name] = float(ms)
+
+    report = {"python": sys.version.split()[0], "platform": sys.platform, "modules": {}}
+    over_budget = False
+    for module in args.only.split(","):
+        if module not in TARGETS:
+            continue
+        result = measure(TARGETS[module][0], args.runs)
+        result["budget_ms"] = budgets.get(module)
+        report["modules"][module] = result
+
+        if "error" in result:
+            print(f"{module:<8} SKIP  {result['error']}")
+            continue
+        ok = result["budget_ms"] is None or result["median_ms"] <= result["budget_ms"]
+        over_budget |= not ok
+        slowest = ", ".join(f"{item['module']} {item['ms']:.1f}" for item in result["slowest_imports"][:3])
+        print(
+            f"{module:<8} {'ok  ' if ok else 'SLOW'} "
+            f"{result['median_ms']:7.1f} ms (limite {result['budget_ms']} ms)  [{slowest}]"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
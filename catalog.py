@@ -0,0 +1,174 @@
+import os
+import json
+import threading
+
+from utils import parse_backup_name, TIMESTAMP_FORMAT
+from publish import write_atomic
+
+# ===================== CATÁLOGO DE BACKUPS =====================
+# Índice dos backups da pasta sincronizada (.msb_catalog.json), atualizado
+# por cada backup no momento em que é escrito. A restauração encontra o
+# backup mais recente de uma unidade sem listar a pasta inteira, o que é
+# lento no Google Drive com milhares de arquivos. Se o catálogo sumir ou
+# apontar para um arquivo que não existe mais, ele é refeito pela listagem.
+#
+# Depois de cada gravação o mtime do catálogo é igualado ao da pasta. Um
+# arquivo que chega depois (backup de outro PC que o Drive baixou antes do
+# catálogo, ou catálogo de outro PC que sobrescreveu o nosso) muda o mtime
+# da pasta: pasta mais nova que o catálogo = catálogo desatualizado, e um
+# stat a mais por consulta basta para perceber. Toda gravação parte da
+# listagem da pasta quando o catálogo está desatualizado; senão o carimbo de
+# mtime esconderia para sempre o arquivo que chegou de fora.
+
+CATALOG_FILE = ".msb_catalog.json"
+
+_lock = threading.Lock()
+_cache = {}  # caminho do catálogo → (mtime_ns, dados)
+
+
+def _catalog_path(sync_dir):
+    return os.path.join(sync_dir, CATALOG_FILE)
+
+
+def _empty():
+    return {"version": 1, "entries": {}}
+
+
+def _read(sync_dir):
+    """Lê o catálogo (com cache por mtime). Retorna None se não existir ou for inválido."""
+    path = _catalog_path(sync_dir)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+    cached = _cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return None
+    if not isinstance(data.get("entries"), dict):
+        return None
+
+    _cache[path] = (mtime, data)
+    return data
+
+
+def _write(sync_dir, data):
+    path = _catalog_path(sync_dir)
+    write_atomic(path, json.dumps(data, indent=1, ensure_ascii=False).encode("utf-8"))
+    try:
+        # O rename mexeu no mtime da pasta; o catálogo passa a ter o mesmo
+        dir_mtime = os.stat(sync_dir).st_mtime_ns
+        os.utime(path, ns=(dir_mtime, dir_mtime))
+    except OSError:
+        pass
+    _cache[path] = (os.stat(path).st_mtime_ns, data)
+
+
+def _is_stale(sync_dir):
+    """True se a pasta mudou depois da última gravação do catálogo."""
+    try:
+        return os.stat(sync_dir).st_mtime_ns > os.stat(_catalog_path(sync_dir)).st_mtime_ns
+    except OSError:
+        return True
+
+
+def _scan(sync_dir):
+    """Catálogo novo pela listagem da pasta; hash e base vêm do atual. Chamar com _lock."""
+    old = _read(sync_dir) or _empty()
+    data = _empty()
+    with os.scandir(sync_dir) as it:
+        for entry in it:
+            parsed = parse_backup_name(entry.name)
+            if not parsed or not entry.is_file():
+                continue
+            unit, stamp, _ = parsed
+            known = old["entries"].get(entry.name, {})
+            data["entries"][entry.name] = {
+                "unit": unit,
+                "timestamp": stamp.strftime(TIMESTAMP_FORMAT),
+                "size": entry.stat().st_size,
+                "sha256": known.get("sha256"),
+            }
+            if known.get("base"):
+                data["entries"][entry.name]["base"] = known["base"]
+    return data
+
+
+def _current(sync_dir):
+    """Catálogo a alterar: o gravado, ou o da listagem se estiver desatualizado. Chamar com _lock."""
+    data = _read(sync_dir)
+    if data is None or _is_stale(sync_dir):
+        data = _scan(sync_dir)
+    return data
+
+
+def rebuild_catalog(sync_dir):
+    """Refaz o catálogo a partir de uma listagem da pasta (sem hashes)."""
+    with _lock:
+        data = _scan(sync_dir)
+        _write(sync_dir, data)
+        return data
+
+
+def add_backup(sync_dir, file_name, size, sha256=None, **extra):
+    """Registra um backup recém-criado no catálogo."""
+    parsed = parse_backup_name(file_name)
+    if not parsed:
+        return
+    unit, stamp, _ = parsed
+    with _lock:
+        # Desatualizado: o próprio backup recém-publicado já entra pela listagem
+        data = _current(sync_dir)
+        data["entries"][file_name] = dict(
+            unit=unit,
+            timestamp=stamp.strftime(TIMESTAMP_FORMAT),
+            size=size,
+            sha256=sha256,
+            **extra,
+        )
+        _write(sync_dir, data)
+
+
+def remove_backups(sync_dir, file_names):
+    """Remove entradas do catálogo (ex.: backups apagados)."""
+    with _lock:
+        if _read(sync_dir) is None:
+            return
+        data = _current(sync_dir)
+        for name in file_names:
+            data["entries"].pop(name, None)
+        _write(sync_dir, data)
+
+
+def list_backups(sync_dir, unit):
+    """Backups da unidade, do mais recente para o mais antigo: [(nome, entrada)]."""
+    if _read(sync_dir) is None or _is_stale(sync_dir):
+        rebuild_catalog(sync_dir)
+    # add_backup/remove_backups alteram o dicionário do cache em outras threads
+    with _lock:
+        data = _read(sync_dir) or _empty()
+        items = [
+            (name, dict(entry)) for name, entry in data["entries"].items()
+            if entry.get("unit") == unit
+        ]
+    items.sort(key=lambda item: item[1].get("timestamp", ""), reverse=True)
+    return items
+
+
+def latest_backup(sync_dir, unit):
+    """Nome do backup mais recente da unidade, ou None."""
+    items = list_backups(sync_dir, unit)
+    if items and os.path.exists(os.path.join(sync_dir, items[0][0])):
+        return items[0][0]
+
+    # Arquivo apagado sem passar pelo catálogo: refaz pela listagem da pasta
+    # (backups novos que não estão no catálogo já foram vistos por list_backups)
+    rebuild_catalog(sync_dir)
+    items = list_backups(sync_dir, unit)
+    return items[0][0] if items else None
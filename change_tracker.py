@@ -0,0 +1,113 @@
+import os
+import json
+import hashlib
+import threading
+
+from archiver import iter_tree
+
+# ===================== DETECÇÃO DE ALTERAÇÕES =====================
+# Guarda, por unidade de backup, o estado dos arquivos no último backup
+# bem-sucedido (caminho relativo → tamanho, mtime e opcionalmente hash).
+# Se nada mudou desde então, a unidade nem é compactada.
+
+STATE_FILE = "backup_state.json"
+
+_lock = threading.Lock()
+
+
+def _load_state():
+    try:
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except Exception:
+        return {"units": {}}
+    if not isinstance(state.get("units"), dict):
+        return {"units": {}}
+    return state
+
+
+def _save_state(state):
+    tmp_path = STATE_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, ensure_ascii=False)
+    os.replace(tmp_path, STATE_FILE)
+
+
+def _file_hash(path):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def scan_tree(root, previous=None, with_hash=False):
+    """
+    Estado atual da pasta: {caminho_relativo: [tamanho, mtime_ns, hash]}.
+    Com with_hash, o hash só é recalculado para arquivos cujo tamanho ou
+    mtime mudou; os demais reaproveitam o hash de previous.
+    """
+    previous = previous or {}
+    files = {}
+    for path, arcname in iter_tree(root):
+        if arcname.endswith("/"):
+            files[arcname] = [0, 0, None]
+            continue
+        st = os.stat(path)
+        digest = None
+        if with_hash:
+            old = previous.get(arcname)
+            if old and old[0] == st.st_size and old[1] == st.st_mtime_ns and old[2]:
+                digest = old[2]
+            else:
+                digest = _file_hash(path)
+        files[arcname] = [st.st_size, st.st_mtime_ns, digest]
+    return files
+
+
+def _same(previous, current, with_hash):
+    if previous.keys() != current.keys():
+        return False
+    for key, (size, mtime, digest) in current.items():
+        old_size, old_mtime, old_digest = previous[key]
+        if size != old_size:
+            return False
+        if mtime != old_mtime:
+            # mtime mudou mas o conteúdo pode ser o mesmo
+            if not (with_hash and digest and digest == old_digest):
+                return False
+    return True
+
+
+def detect_changes(unit, root, sync_dir, with_hash=False):
+    """
+    Compara a pasta com o último backup registrado da unidade.
+    Retorna (mudou, estado_atual); estado_atual deve ser passado a
+    record_backup depois que o backup terminar.
+    """
+    with _lock:
+        entry = _load_state()["units"].get(unit)
+
+    previous = entry.get("files", {}) if entry else {}
+    current = scan_tree(root, previous, with_hash)
+
+    if not entry:
+        return True, current
+    if entry.get("sync_dir") != os.path.abspath(sync_dir):
+        return True, current
+    # O backup anterior precisa continuar existindo no destino
+    if not os.path.exists(os.path.join(sync_dir, entry.get("backup", ""))):
+        return True, current
+    return not _same(previous, current, with_hash), current
+
+
+def record_backup(unit, sync_dir, backup_name, files):
+    """Salva o estado usado no backup que acabou de ser criado."""
+    with _lock:
+        state = _load_state()
+        state["units"][unit] = {
+            "sync_dir": os.path.abspath(sync_dir),
+            "backup": backup_name,
+            "files": files,
+        }
+        _save_state(state)
@@ -0,0 +1,304 @@
+"""
+Linha de comando sem interface gráfica (nunca importa customtkinter).
+
+Uso (na pasta com config.json / extra_backups.json):
+  python -m cli [--json] [-C PASTA] backup  [--unit NOME ...]
+  python -m cli [--json] [-C PASTA] restore [--unit NOME ...]
+  python -m cli [--json] [-C PASTA] prune   [--unit NOME ...] [--dry-run]
+  python -m cli [--json] [-C PASTA] verify  [--unit NOME ...] [--latest]
+  python -m cli [--json] [-C PASTA] undo    [--unit NOME ...] [--yes] [--force]
+  python -m cli [--json] [-C PASTA] daemon  [--unit NOME ...] [--once]
+
+Código de saída: 0 tudo certo, 1 alguma unidade falhou (ou, no verify,
+algum backup está corrompido), 2 erro de uso
+(argumentos inválidos, unidade desconhecida ou nenhuma unidade habilitada).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Multi Savedata Backup (headless)")
+    parser.add_argument("--json", action="store_true", help="print per-unit results as JSON")
+    parser.add_argument("-C", "--directory", help="folder with config.json and extra_backups.json")
+    parser.add_argument("--workers", type=int, help="units run at the same time (default: max_workers from config)")
+
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+
+    for name, text in (("backup", "back up every enabled unit"),
+                       ("restore", "restore the latest backup of every enabled unit"),
+                       ("prune", "apply the retention policy without backing up"),
+                       ("verify", "check every backup in the sync folder for corruption"),
+                       ("undo", "put the saves back to how they were before the last restore"),
+                       ("daemon", "stay running and back up each unit on its schedule")):
+        command = commands.add_parser(name, help=text)
+        command.add_argument("--unit", action="append", metavar="NAME",
+                             help="only this unit (label or backup name, repeatable)")
+        if name == "prune":
+            command.add_argument("--dry-run", action="store_true", help="only report what would be removed")
+        if name == "verify":
+            command.add_argument("--latest", action="store_true", help="only the newest backup of each unit")
+        if name == "undo":
+            command.add_argument("--yes", action="store_true", help="do not ask for confirmation")
+            command.add_argument("--force", action="store_true",
+                                 help="also undo folders that changed after the restore (their new files are lost)")
+        if name == "daemon":
+            command.add_argument("--once", action="store_true", help="back up the units that are due and exit")
+    return parser
+
+
+def _select(units, wanted, parser):
+    """Filtra (rótulo, prefixo, ...) pelos nomes de --unit; nome desconhecido é erro de uso."""
+    if not wanted:
+        return units
+    keys = {}
+    for unit in units:
+        keys[unit[0].lower()] = unit
+        keys[unit[1].lower()] = unit
+    selected = []
+    for name in wanted:
+        unit = keys.get(name.lower())
+        if unit is None:
+            parser.error(f"unknown or disabled unit: {name}")
+        if unit not in selected:
+            selected.append(unit)
+    return selected
+
+
+def _run_jobs(kind, units, kwargs, config, workers):
+    from runner import run_units
+    import instrumentation
+
+    jobs = [(func, args, kwargs) for _, _, func, args in units]
+    with instrumentation.run(kind, log=config.get("run_log", True), profile=config.get("profile", False)):
+        results = run_units(jobs, workers)
+    return [
+        {"unit": label, "name": prefix, "success": success, "message": msg}
+        for (label, prefix, _, _), (success, msg) in zip(units, results)
+    ]
+
+
+def _prune(units, config, dry_run):
+    from backup import backup_dir
+    from retention import apply_retention, policy_enabled
+    from i18n import tr
+    from utils import format_size
+
+    dest_dir = backup_dir(config.get("backup_root"))
+    now = datetime.now()
+    results = []
+    for label, prefix, policy in units:
+        result = {"unit": label, "name": prefix, "success": True, "deleted": [], "reclaimed_bytes": 0}
+        if not policy_enabled(policy):
+            result["message"] = tr("retention_disabled")
+        else:
+            try:
+                deleted, reclaimed = apply_retention(dest_dir, prefix, policy, now, dry_run=dry_run)
+            except (OSError, ValueError) as e:
+                result.update(success=False, message=tr("retention_error", detail=e))
+            else:
+                key = "retention_dry_run" if dry_run else "retention_pruned"
+                result.update(deleted=deleted, reclaimed_bytes=reclaimed,
+                              message=tr(key, count=len(deleted), size=format_size(reclaimed)))
+        results.append(result)
+    return results
+
+
+def _verify(units, config, latest, workers):
+    from backup import backup_dir
+    from catalog import list_backups
+    from verify import verify_backups
+    from i18n import tr
+
+    dest_dir = backup_dir(config.get("backup_root"))
+    names = {}
+    for _, prefix, _, _ in units:
+        backups = [name for name, _ in list_backups(dest_dir, prefix)] if os.path.isdir(dest_dir) else []
+        names[prefix] = backups[:1] if latest else backups
+
+    # Todos os backups de todas as unidades vão juntos para o pool
+    checked = {}
+    for name, success, detail in verify_backups(dest_dir, [n for backups in names.values() for n in backups], workers):
+        checked[name] = (success, detail)
+
+    results = []
+    for label, prefix, _, _ in units:
+        if not names[prefix]:
+            results.append({"unit": label, "name": prefix, "backup": None, "success": True,
+                            "message": tr("verify_nothing")})
+        for name in names[prefix]:
+            success, detail = checked[name]
+            if success:
+                message = tr("verify_ok", name=name, files=detail[0], hashed=detail[1])
+            else:
+                message = tr("verify_failed", name=name, detail=detail)
+            results.append({"unit": label, "name": prefix, "backup": name, "success": success, "message": message})
+    return results
+
+
+def _undo(units, selected, config, args):
+    """
+    Desfaz a restauração mais recente. Mostra antes o que vai voltar (no
+    stderr) e pede confirmação no terminal; sem terminal exige --yes.
+    Retorna None se o usuário desistiu.
+    """
+    from restore import pending_undo, undo_last_restore, DEFAULT_MAX_DAYS
+    from i18n import tr
+
+    labels = {prefix: label for label, prefix, _, _ in units}
+    wanted = {unit[1] for unit in selected} if selected else None
+    max_days = config.get("restore_rollback_days", DEFAULT_MAX_DAYS)
+    pending = pending_undo(wanted, max_days)
+    if not pending:
+        return [{"unit": "-", "name": None, "success": True, "message": tr("undo_nothing")}]
+
+    if not args.yes:
+        print(_undo_plan(pending, labels), file=sys.stderr)
+        if not sys.stdin.isatty():
+            print("undo: confirm with --yes", file=sys.stderr)
+            return None
+        if input("[y/N] ").strip().lower() not in ("y", "yes", "s", "sim"):
+            return None
+
+    return [
+        {"unit": labels.get(prefix, prefix), "name": prefix, "success": success, "message": msg}
+        for prefix, success, msg in undo_last_restore({prefix for prefix, _, _ in pending}, args.force, max_days)
+    ]
+
+
+def _undo_plan(pending, labels):
+    """Texto de confirmação: cada unidade, quando foi restaurada e o que mudou depois."""
+    from i18n import tr
+
+    lines = [tr("undo_confirm")]
+    for prefix, entry, changed in pending:
+        lines.append(tr("undo_confirm_unit", name=labels.get(prefix, prefix), backup=entry.get("backup"),
+                        time=entry.get("created", "?").replace("T", " ")))
+        if changed:
+            lines.append(tr("undo_confirm_changed", count=len(changed), files=", ".join(changed[:3])))
+    return "\n".join(lines)
+
+
+def _report(command, results, seconds, as_json):
+    ok = all(result["success"] for result in results)
+    if as_json:
+        print(json.dumps({
+            "command": command,
+            "success": ok,
+            "seconds": round(seconds, 3),
+            "units": results,
+        }, ensure_ascii=False, indent=2))
+    else:
+        for result in results:
+            status = "OK " if result["success"] else "ERR"
+            print(f"[{status}] {result['unit']}: {result['message']}")
+    return EXIT_OK if ok else EXIT_FAILED
+
+
+def _daemon(args, parser):
+    from daemon import Scheduler
+    from runner import backup_units
+    from config import load_config
+    from extra_backups import load_extra_backups
+
+    if args.unit:
+        _select(backup_units(load_config(), load_extra_backups().get("extras", [])), args.unit, parser)
+
+    def on_result(label, prefix, success, msg):
+        # Uma linha por backup (JSON lines com --json), já com flush para logs
+        if args.json:
+            print(json.dumps({
+                "time": datetime.now().isoformat(timespec="seconds"),
+                "unit": label, "name": prefix, "success": success, "message": msg,
+            }, ensure_ascii=False), flush=True)
+        else:
+            status = "OK " if success else "ERR"
+            print(f"{datetime.now():%Y-%m-%d %H:%M:%S} [{status}] {label}: {msg}", flush=True)
+
+    scheduler = Scheduler(only=args.unit, on_result=on_result, once=args.once)
+    if not scheduler.units:
+        from i18n import tr
+        print(tr("no_units_enabled"), file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.once:
+        results = scheduler.run_due()
+        return EXIT_OK if all(success for _, _, success, _ in results) else EXIT_FAILED
+
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        scheduler.stop()
+    return EXIT_OK
+
+
+def main(argv=None):
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+
+    if args.directory:
+        try:
+            os.chdir(args.directory)
+        except OSError as e:
+            parser.error(str(e))
+
+    if args.command == "daemon":
+        return _daemon(args, parser)
+
+    # Só módulos sem interface: config/extras e as mesmas funções do app
+    from config import load_config
+    from extra_backups import load_extra_backups
+    from runner import backup_units, restore_units, prune_units
+
+    config = load_config()
+    extras = load_extra_backups().get("extras", [])
+    workers = args.workers if args.workers is not None else config.get("max_workers")
+
+    start = time.perf_counter()
+    if args.command == "prune":
+        units = _select(prune_units(config, extras), args.unit, parser)
+    elif args.command in ("backup", "verify"):
+        units = _select(backup_units(config, extras), args.unit, parser)
+    elif args.command == "undo":
+        # Sem --unit desfaz todas as unidades da última restauração, mesmo as já desabilitadas
+        units = restore_units(config, extras)
+        selected = _select(units, args.unit, parser) if args.unit else None
+        results = _undo(units, selected, config, args)
+        if results is None:
+            from i18n import tr
+            print(tr("undo_cancelled"), file=sys.stderr)
+            return EXIT_USAGE
+        return _report(args.command, results, time.perf_counter() - start, args.json)
+    else:
+        units = _select(restore_units(config, extras), args.unit, parser)
+
+    if not units:
+        from i18n import tr
+        print(tr("no_units_enabled"), file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.command == "prune":
+        results = _prune(units, config, args.dry_run)
+    elif args.command == "verify":
+        results = _verify(units, config, args.latest, workers)
+    elif args.command == "backup":
+        from backup import backup_options
+        results = _run_jobs("backup", units, backup_options(config), config, workers)
+    else:
+        from restore import restore_options
+        results = _run_jobs("restore", units, restore_options(config), config, workers)
+
+    return _report(args.command, results, time.perf_counter() - start, args.json)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,25 @@
 import json
 import os
+from functools import lru_cache
 
 CONFIG_FILE = "config.json"
 
 # ===== Funções para detectar diretórios padrão =====
-def detect_default_ppsspp():
-    path = os.path.join(os.getenv('APPDATA'), "PPSSPP")
+# A detecção só roda quando a chave falta no config.json, e o resultado fica
+# guardado (lru_cache) para o resto da execução. Variáveis de ambiente
+# ausentes (ex.: APPDATA fora do Windows) simplesmente não detectam nada.
+
+def _existing_dir(env_var, *parts):
+    base = os.getenv(env_var)
+    if not base:
+        return ""
+    path = os.path.join(base, *parts)
     return path if os.path.isdir(path) else ""
 
+@lru_cache(maxsize=None)
+def detect_default_ppsspp():
+    return _existing_dir("APPDATA", "PPSSPP")
+
 def validate_ppsspp_path(path):
     """Verifica se o diretório contém a estrutura PSP/SAVEDATA"""
     return (
@@ -15,17 +27,17 @@ def validate_ppsspp_path(path):
         os.path.isdir(os.path.join(path, "PSP", "SAVEDATA"))
     )
 
+@lru_cache(maxsize=None)
 def detect_default_pcsx2():
-    path = os.path.join(os.getenv('USERPROFILE'), "Documents", "PCSX2")
-    return path if os.path.isdir(path) else ""
+    return _existing_dir("USERPROFILE", "Documents", "PCSX2")
 
 def validate_pcsx2_path(path):
     """Verifica se o diretório contém a estrutura PCSX2/memcards"""
     return os.path.isdir(os.path.join(path, "memcards"))
 
+@lru_cache(maxsize=None)
 def detect_default_citra():
-    path = os.path.join(os.getenv('APPDATA'), "Citra")
-    return path if os.path.isdir(path) else ""
+    return _existing_dir("APPDATA", "Citra")
 
 def validate_citra_path(path):
     """Verifica se o diretório contém a estrutura Citra/sdmc"""
@@ -57,19 +69,46 @@ def validate_custom_dir(dir_entry):
             return False
     return True
 
+@lru_cache(maxsize=None)
 def detect_google_drive():
-    path = os.path.join(os.getenv('USERPROFILE'), "Google Drive")
-    return path if os.path.isdir(path) else ""
+    return _existing_dir("USERPROFILE", "Google Drive")
 
 # ===== Configuração padrão =====
+# Caminhos detectados na máquina: calculados só quando faltam no config
+DETECTED_DEFAULTS = {
+    "ppsspp_path": detect_default_ppsspp,
+    "pcsx2_path": detect_default_pcsx2,
+    "citra_path": detect_default_citra,
+    "backup_root": detect_google_drive,
+}
+
 DEFAULT_CONFIG = {
-    "ppsspp_path": detect_default_ppsspp(),
-    "pcsx2_path": detect_default_pcsx2(),
-    "citra_path": detect_default_citra(),
-    "backup_root": detect_google_drive(),
     "ppsspp_enabled": False,
     "pcsx2_enabled": False,
     "citra_enabled": False,
+    "repository_mode": False,
+    "skip_unchanged": True,
+    "change_hash": False,
+    "adaptive_compression": True,
+    "compress_workers": 0,
+    "archive_format": "zip",
+    "archive_format_units": {},
+    "delta_units": [],
+    "delta_full_every": 10,
+    "restore_rollback": True,
+    "restore_rollback_days": 7,
+    "restore_differential": True,
+    "max_workers": 4,
+    "retention": {"keep_last": 0, "keep_daily": 0, "keep_weekly": 0},
+    "retention_units": {},
+    "retention_dry_run": False,
+    "schedule": {"interval_minutes": 60, "jitter_seconds": 60, "catch_up": "immediate"},
+    "schedule_units": {},
+    "watch": False,
+    "watch_quiet_seconds": 30,
+    "watch_poll_seconds": 5,
+    "run_log": True,
+    "profile": False,
     "theme": "system",
     "window_width": 900,
     "window_height": 700,
@@ -81,7 +120,8 @@ DEFAULT_CONFIG = {
 def load_config():
     # PRIMEIRA EXECUÇÃO (sem config.json)
     if not os.path.exists(CONFIG_FILE):
-        cfg = DEFAULT_CONFIG.copy()
+        cfg = {key: detect() for key, detect in DETECTED_DEFAULTS.items()}
+        cfg.update(DEFAULT_CONFIG)
 
         # UX: mostrar um exemplo funcional
         cfg["ppsspp_enabled"] = True
@@ -92,6 +132,9 @@ def load_config():
         cfg = json.load(f)
 
     # Completa apenas chaves ausentes
+    for key, detect in DETECTED_DEFAULTS.items():
+        if key not in cfg:
+            cfg[key] = detect()
     for key, default_value in DEFAULT_CONFIG.items():
         if key not in cfg:
             cfg[key] = default_value
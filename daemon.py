@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import random
+import threading
+
+from config import load_config, CONFIG_FILE
+from extra_backups import load_extra_backups, EXTRA_BACKUP_FILE
+from backup import backup_options
+from runner import backup_units, run_units
+from watcher import Watcher, unit_folders, DEFAULT_QUIET_SECONDS, DEFAULT_POLL_SECONDS
+import instrumentation
+
+# ===================== AGENDADOR (MODO DAEMON) =====================
+# Processo residente que faz os backups sozinho, unidade por unidade:
+#   interval_minutes → intervalo entre backups bem-sucedidos da unidade
+#   jitter_seconds   → atraso aleatório somado a cada agendamento, para as
+#                      unidades não baterem todas no mesmo segundo (só no
+#                      processo residente; --once, rodado pelo cron/agendador
+#                      de tarefas, não sorteia nada)
+#   catch_up         → o que fazer com horários perdidos (PC suspenso,
+#                      desligado): "immediate" roda uma vez assim que
+#                      possível, "skip" espera o próximo horário regular
+# O último sucesso de cada unidade fica em schedule_state.json, então as
+# unidades mais atrasadas vão primeiro, inclusive depois de reiniciar. O
+# horário para onde "skip" empurrou a unidade também fica lá (next_due):
+# sem isso cada --once recalcularia o mesmo horário perdido e pularia de novo.
+# config.json/extra_backups.json são lidos uma vez e só recarregados quando
+# mudam no disco.
+# Com "watch": true, as pastas de saves também são observadas (watcher.py) e
+# uma unidade alterada é copiada logo depois que o emulador para de gravar,
+# sem esperar o intervalo.
+
+STATE_FILE = "schedule_state.json"
+
+DEFAULT_SCHEDULE = {
+    "interval_minutes": 60,
+    "jitter_seconds": 60,
+    "catch_up": "immediate",
+}
+
+# Depois de uma falha, tenta de novo em 5, 10, 20... minutos (até o intervalo)
+RETRY_MINUTES = 5
+
+# O laço acorda pelo menos a cada MAX_SLEEP segundos para notar suspensão
+# e mudanças no config; atrasos menores que CATCH_UP_GRACE não contam como
+# horário perdido.
+MAX_SLEEP = 60
+CATCH_UP_GRACE = 2 * MAX_SLEEP
+
+# Com --once, uma unidade que vence até ONCE_LEAD segundos depois também roda:
+# o cron chama de minuto em minuto e a chamada seguinte, exatamente um
+# intervalo depois, chega frações de segundo antes do vencimento.
+ONCE_LEAD = MAX_SLEEP
+
+
+def load_schedule_state():
+    try:
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except Exception:
+        return {"units": {}}
+    if not isinstance(state.get("units"), dict):
+        return {"units": {}}
+    return state
+
+
+def save_schedule_state(state):
+    tmp_path = STATE_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, ensure_ascii=False)
+    os.replace(tmp_path, STATE_FILE)
+
+
+def unit_schedules(config, extras):
+    """
+    Agenda de cada unidade habilitada: [(rótulo, prefixo, função, args, agenda)].
+    Mesma precedência da retenção: a extra pode ter "schedule" próprio, senão
+    schedule_units[prefixo], senão schedule.
+    """
+    default = dict(DEFAULT_SCHEDULE, **(config.get("schedule") or {}))
+    per_unit = config.get("schedule_units") or {}
+    extra_schedules = {}
+    for extra in extras:
+        if extra.get("schedule"):
+            extra_schedules[(extra.get("name") or "").replace(" ", "_")] = extra["schedule"]
+
+    units = []
+    for label, prefix, func, args in backup_units(config, extras):
+        schedule = dict(default, **(extra_schedules.get(prefix) or per_unit.get(prefix) or {}))
+        units.append((label, prefix, func, args, schedule))
+    return units
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class Scheduler:
+    """
+    Agenda e executa os backups. run_forever() bloqueia até stop();
+    run_due() faz uma única rodada (o que estiver vencido).
+    once=True é o modo de uma rodada só (cron): sem jitter e com ONCE_LEAD.
+    only limita as unidades (rótulos ou prefixos); on_result(rótulo, prefixo,
+    sucesso, mensagem) é chamado para cada backup feito.
+    """
+
+    def __init__(self, only=None, on_result=None, clock=time.time, once=False):
+        self.only = {name.lower() for name in only} if only else None
+        self.once = once
+        self.on_result = on_result
+        self.clock = clock
+        self.state = load_schedule_state()
+        self.next_due = {}
+        self.requested = set()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.sources = None
+        self.reload()
+
+    # ----- configuração -----
+    def _source_mtimes(self):
+        return _mtime(CONFIG_FILE), _mtime(EXTRA_BACKUP_FILE)
+
+    def reload(self):
+        """Lê config/extras e refaz a agenda de quem mudou."""
+        self.sources = self._source_mtimes()
+        self.config = load_config()
+        extras = load_extra_backups().get("extras", [])
+        self.options = backup_options(self.config)
+
+        units = unit_schedules(self.config, extras)
+        if self.only is not None:
+            units = [unit for unit in units if unit[0].lower() in self.only or unit[1].lower() in self.only]
+        self.units = {unit[1]: unit for unit in units}
+        self.folders = {
+            prefix: folder for prefix, folder in unit_folders(self.config, extras).items()
+            if prefix in self.units
+        }
+
+        now = self.clock()
+        previous = self.next_due
+        self.next_due = {}
+        for prefix, unit in self.units.items():
+            old = previous.get(prefix)
+            if old is not None and old[1] == unit[4]:
+                self.next_due[prefix] = old
+            else:
+                self.next_due[prefix] = (self._due_time(prefix, unit[4], now), unit[4])
+
+    def _reload_if_changed(self):
+        if self._source_mtimes() != self.sources:
+            self.reload()
+
+    def _due_time(self, prefix, schedule, now):
+        entry = self.state["units"].get(prefix) or {}
+        if entry.get("next_due"):
+            # Horário perdido já pulado (catch_up "skip")
+            return entry["next_due"]
+        interval = float(schedule.get("interval_minutes") or DEFAULT_SCHEDULE["interval_minutes"]) * 60
+        jitter = 0 if self.once else random.uniform(0, float(schedule.get("jitter_seconds") or 0))
+
+        failures = entry.get("failures", 0)
+        if failures and entry.get("last_attempt"):
+            retry = min(interval, RETRY_MINUTES * 60 * 2 ** (failures - 1))
+            return entry["last_attempt"] + retry + jitter
+        if entry.get("last_success"):
+            return entry["last_success"] + interval + jitter
+        # Nunca teve backup: agora
+        return now
+
+    # ----- execução -----
+    def request(self, prefixes=None):
+        """Pede backup imediato dessas unidades (todas com None) e acorda o laço."""
+        with self.lock:
+            self.requested.update(prefixes if prefixes is not None else self.units.keys())
+        self.wake.set()
+
+    def stop(self):
+        self.stopping.set()
+        self.wake.set()
+
+    def _take_due(self, now):
+        """Unidades a rodar agora, as mais atrasadas primeiro."""
+        with self.lock:
+            requested, self.requested = self.requested, set()
+
+        lead = ONCE_LEAD if self.once else 0
+        due = []
+        skipped = False
+        for prefix, (due_at, schedule) in self.next_due.items():
+            if prefix in requested:
+                due.append((float("inf"), prefix))
+                continue
+            if due_at > now + lead:
+                continue
+            overdue = now - due_at
+            if overdue > CATCH_UP_GRACE and schedule.get("catch_up") == "skip":
+                # Horário perdido: pula para o próximo horário regular
+                interval = float(schedule.get("interval_minutes") or DEFAULT_SCHEDULE["interval_minutes"]) * 60
+                missed = int(overdue // interval) + 1
+                self.next_due[prefix] = (due_at + missed * interval, schedule)
+                self.state["units"].setdefault(prefix, {})["next_due"] = due_at + missed * interval
+                skipped = True
+                continue
+            due.append((overdue, prefix))
+        if skipped:
+            save_schedule_state(self.state)
+
+        due.sort(reverse=True)
+        return [self.units[prefix] for _, prefix in due]
+
+    def run_due(self):
+        """Roda uma rodada com as unidades vencidas. Retorna [(rótulo, prefixo, sucesso, msg)]."""
+        self._reload_if_changed()
+        started = self.clock()
+        units = self._take_due(started)
+        if not units:
+            return []
+
+        jobs = [(func, args, self.options) for _, _, func, args, _ in units]
+        with instrumentation.run("backup", log=self.config.get("run_log", True),
+                                 profile=self.config.get("profile", False)):
+            results = run_units(jobs, self.config.get("max_workers"))
+
+        finished = self.clock()
+        report = []
+        for (label, prefix, _, _, schedule), (success, msg) in zip(units, results):
+            entry = self.state["units"].setdefault(prefix, {})
+            entry["last_attempt"] = finished
+            entry.pop("next_due", None)
+            if success:
+                entry["last_success"] = started
+                entry["failures"] = 0
+            else:
+                entry["failures"] = entry.get("failures", 0) + 1
+            self.next_due[prefix] = (self._due_time(prefix, schedule, finished), schedule)
+            report.append((label, prefix, success, msg))
+        save_schedule_state(self.state)
+
+        if self.on_result:
+            for item in report:
+                self.on_result(*item)
+        return report
+
+    def seconds_until_next(self):
+        if not self.next_due:
+            return MAX_SLEEP
+        earliest = min(due_at for due_at, _ in self.next_due.values())
+        return min(MAX_SLEEP, max(0.0, earliest - self.clock()))
+
+    def _start_watcher(self):
+        if not self.config.get("watch") or not self.folders:
+            return None
+        watcher = Watcher(
+            self.folders, self.request,
+            quiet_seconds=self.config.get("watch_quiet_seconds", DEFAULT_QUIET_SECONDS),
+            poll_seconds=self.config.get("watch_poll_seconds", DEFAULT_POLL_SECONDS),
+        )
+        watcher.start()
+        return watcher
+
+    def run_forever(self):
+        watcher = self._start_watcher()
+        try:
+            while not self.stopping.is_set():
+                self.run_due()
+                # Config mudou: observa as pastas novas
+                wanted = self.folders if self.config.get("watch") else {}
+                if (watcher.folders if watcher else {}) != wanted:
+                    if watcher:
+                        watcher.stop()
+                    watcher = self._start_watcher()
+                # Dorme até o próximo vencimento (ou request()/stop()); depois de
+                # uma suspensão o relógio pulou e as unidades já aparecem vencidas
+                self.wake.wait(self.seconds_until_next())
+                self.wake.clear()
+        finally:
+            if watcher:
+                watcher.stop()
@@ -0,0 +1,424 @@
+import os
+import json
+import zlib
+import hashlib
+import zipfile
+
+from archiver import (
+    iter_tree, group_of, is_selected, is_metadata, choose_compression, extract_member, write_hashed, local_size,
+    manifest_data, _HashingWriter, _member_target, EXTRACT_BUFFER, METADATA_PREFIX, MANIFEST_MEMBER,
+)
+from catalog import list_backups
+from publish import publishing
+
+# ===================== BACKUP DELTA (ESTILO RSYNC) =====================
+# Cartões de memória do PCSX2 têm 8 MB ou mais e cada save muda só alguns
+# clusters. Para as unidades em "delta_units", o backup completo (a base)
+# leva junto as assinaturas dos arquivos grandes: para cada bloco, um
+# checksum fraco (adler32, que pode "rolar" byte a byte) e um forte
+# (BLAKE2b). Os backups seguintes (<prefixo>_<timestamp>.delta.zip) comparam
+# os arquivos com essas assinaturas e guardam só os trechos que mudaram,
+# mais a lista de blocos a copiar da base. A cada delta_full_every backups
+# sai uma base nova.
+#
+# Cada delta é sempre relativo à base (não ao delta anterior): restaurar
+# exige só a base e um delta, e apagar um delta não quebra os outros.
+
+DELTA_SUFFIX = ".delta.zip"
+
+SIGNATURES_MEMBER = METADATA_PREFIX + "signatures.json"
+DELTA_META = METADATA_PREFIX + "delta.json"
+# Trechos novos de cada arquivo, concatenados: <LITERALS_DIR><caminho>
+LITERALS_DIR = METADATA_PREFIX + "delta/"
+
+# Arquivos menores que isso vão inteiros (o delta não compensa)
+DELTA_MIN_SIZE = 64 * 1024
+# ...e maiores também: o delta monta o arquivo inteiro em memória (na
+# gravação e na restauração). Cartões de memória ficam bem abaixo; arquivos
+# grandes de uma unidade como o sdmc do Citra não prendem a RAM.
+DELTA_MAX_SIZE = 64 * 1024 * 1024
+MIN_BLOCK = 4 * 1024
+# Se mais que isso do arquivo for novo, ele vai inteiro
+MAX_LITERAL_RATIO = 0.5
+# Procurar blocos deslocados custa ~1 µs por byte em Python; passado esse
+# orçamento (fração do arquivo), só blocos na posição atual são testados
+SEARCH_BUDGET = 0.125
+
+_ADLER_MOD = 65521
+_STRONG_SIZE = 16
+
+
+def block_size_for(size):
+    """Bloco perto de sqrt(tamanho), em potência de 2 (4 KiB num cartão de 8 MB)."""
+    block = MIN_BLOCK
+    while block * block < size:
+        block *= 2
+    return block
+
+
+def _strong(data):
+    return hashlib.blake2b(data, digest_size=_STRONG_SIZE).digest()
+
+
+def _file_hash(data):
+    return hashlib.blake2b(data).hexdigest()
+
+
+def file_signature(f, size):
+    """
+    Assinatura do arquivo aberto f (size bytes), lido bloco a bloco: blocos
+    inteiros (o último, parcial, não entra). Retorna (crc32, assinatura).
+    """
+    block = block_size_for(size)
+    weak = []
+    strong = []
+    crc = 0
+    digest = hashlib.blake2b()
+    read = 0
+    while True:
+        chunk = f.read(block)
+        if not chunk:
+            break
+        read += len(chunk)
+        crc = zlib.crc32(chunk, crc)
+        digest.update(chunk)
+        if len(chunk) == block:
+            weak.append(zlib.adler32(chunk))
+            strong.append(_strong(chunk).hex())
+    return crc, {
+        "size": read,
+        "block": block,
+        "hash": digest.hexdigest(),
+        "weak": weak,
+        "strong": "".join(strong),
+    }
+
+
+def signatures_for(source_dir):
+    """
+    Calcula as assinaturas dos arquivos grandes de source_dir e devolve a
+    função extra_members para create_zip. Ela recebe {nome: ZipInfo} do que
+    foi gravado e descarta a assinatura de quem mudou entre a leitura daqui e
+    a do zip (CRC diferente): o delta nunca aponta para blocos que a base não tem.
+    """
+    files = {}
+    for path, arcname in iter_tree(source_dir):
+        if arcname.endswith("/"):
+            continue
+        size = os.path.getsize(path)
+        if not DELTA_MIN_SIZE <= size <= DELTA_MAX_SIZE:
+            continue
+        with open(path, "rb") as f:
+            files[arcname] = file_signature(f, size)
+
+    def members(infos):
+        valid = {
+            arcname: signature for arcname, (crc, signature) in files.items()
+            if arcname in infos and infos[arcname].CRC == crc
+        }
+        return {SIGNATURES_MEMBER: json.dumps({"version": 1, "files": valid}).encode("utf-8")}
+
+    return members
+
+
+def _add_copy(ops, index):
+    if ops and ops[-1][0] == "c" and ops[-1][1] + ops[-1][2] == index:
+        ops[-1][2] += 1
+    else:
+        ops.append(["c", index, 1])
+
+
+def encode_delta(data, signature):
+    """
+    Compara data com a assinatura da base. Retorna (ops, literais) ou None se
+    o arquivo mudou demais. ops: ["c", primeiro_bloco, quantidade] copia da
+    base, ["l", tamanho] lê o próximo trecho de literais.
+    """
+    size = len(data)
+    n = signature["block"]
+    blocks = len(signature["weak"])
+    if _file_hash(data) == signature["hash"]:
+        return [["c", 0, blocks + (1 if signature["size"] % n else 0)]], b""
+
+    strong = bytes.fromhex(signature["strong"])
+    weak = {}
+    for index, value in enumerate(signature["weak"]):
+        weak.setdefault(value, []).append(index)
+
+    max_literal = size * MAX_LITERAL_RATIO
+    budget = int(size * SEARCH_BUDGET)
+    ops = []
+    literal = bytearray()
+    lit_start = 0
+    p = 0
+    fresh = True
+    a = b = w = 0
+
+    while p + n <= size:
+        if fresh:
+            w = zlib.adler32(data[p:p + n])
+            a, b = w & 0xffff, w >> 16
+            fresh = False
+
+        match = None
+        candidates = weak.get(w)
+        if candidates:
+            digest = _strong(data[p:p + n])
+            # Prefere o bloco seguinte ao último copiado (junta as cópias)
+            expected = ops[-1][1] + ops[-1][2] if ops and ops[-1][0] == "c" and lit_start == p else None
+            for index in sorted(candidates, key=lambda i: i != expected):
+                if strong[index * _STRONG_SIZE:(index + 1) * _STRONG_SIZE] == digest:
+                    match = index
+                    break
+
+        if match is not None:
+            if lit_start < p:
+                literal += data[lit_start:p]
+                ops.append(["l", p - lit_start])
+                if len(literal) > max_literal:
+                    return None
+            _add_copy(ops, match)
+            p += n
+            lit_start = p
+            fresh = True
+        elif budget <= 0 or p + n == size:
+            # Sem orçamento: o bloco inteiro vira literal e o teste segue alinhado
+            p += n
+            fresh = True
+            if p - lit_start + len(literal) > max_literal:
+                return None
+        else:
+            # Rola a janela um byte (adler32 incremental)
+            out, new = data[p], data[p + n]
+            a = (a - out + new) % _ADLER_MOD
+            b = (b - n * out + a - 1) % _ADLER_MOD
+            w = (b << 16) | a
+            p += 1
+            budget -= 1
+
+    if lit_start < size:
+        literal += data[lit_start:]
+        ops.append(["l", size - lit_start])
+    if len(literal) > max_literal:
+        return None
+    return ops, bytes(literal)
+
+
+def apply_delta(base, ops, literal_stream, block):
+    """Reconstrói o arquivo a partir da base (bytes) e dos literais."""
+    parts = []
+    for op in ops:
+        if op[0] == "c":
+            parts.append(base[op[1] * block:(op[1] + op[2]) * block])
+        else:
+            chunk = literal_stream.read(op[1]) if literal_stream else b""
+            if len(chunk) != op[1]:
+                raise ValueError("Truncated delta literals")
+            parts.append(chunk)
+    return b"".join(parts)
+
+
+# ===================== ESCOLHA DA BASE =====================
+
+def _has_signatures(path):
+    try:
+        with zipfile.ZipFile(path) as zf:
+            return SIGNATURES_MEMBER in zf.NameToInfo
+    except (OSError, zipfile.BadZipFile):
+        return False
+
+
+def find_base(sync_dir, prefix, full_every):
+    """
+    Base para o próximo delta da unidade: o zip completo mais recente com
+    assinaturas. None quando é hora de uma base nova (não há base, ou já
+    saíram full_every - 1 deltas depois dela).
+    """
+    deltas = 0
+    for name, _ in list_backups(sync_dir, prefix):
+        if name.endswith(DELTA_SUFFIX):
+            deltas += 1
+            continue
+        if not name.endswith(".zip"):
+            return None
+        if deltas >= max(1, int(full_every or 1)) - 1:
+            return None
+        if _has_signatures(os.path.join(sync_dir, name)):
+            return name
+        return None
+    return None
+
+
+# ===================== GRAVAÇÃO =====================
+
+def create_delta(source_dir, dest_path, base_path, progress_callback=None, compresslevel=6, adaptive=True):
+    """
+    Grava em dest_path o delta de source_dir em relação à base. Arquivos sem
+    assinatura, pequenos ou que mudaram demais vão inteiros, como num zip normal.
+    Retorna (tamanho, sha256) do arquivo gerado.
+    """
+    with zipfile.ZipFile(base_path) as base_zf:
+        signatures = json.loads(base_zf.read(SIGNATURES_MEMBER))["files"]
+
+    entries = [
+        (path, arcname, 0 if arcname.endswith("/") else os.path.getsize(path))
+        for path, arcname in iter_tree(source_dir)
+    ]
+    total = sum(size for _, _, size in entries)
+    done = 0
+    meta = {"version": 1, "base": os.path.basename(base_path), "files": {}}
+    # O manifesto cobre os arquivos gravados inteiros; os refeitos a partir da
+    # base são conferidos pelo hash do delta.json na restauração
+    hashes = {}
+
+    with publishing(dest_path) as raw:
+        out = _HashingWriter(raw)
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED,
+                             allowZip64=True, compresslevel=compresslevel) as zf:
+            for path, arcname, size in entries:
+                signature = signatures.get(arcname)
+                if signature and DELTA_MIN_SIZE <= size <= DELTA_MAX_SIZE:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    encoded = encode_delta(data, signature)
+                    if encoded is not None:
+                        ops, literal = encoded
+                        meta["files"][arcname] = {
+                            "size": len(data),
+                            "mtime": os.path.getmtime(path),
+                            "hash": _file_hash(data),
+                            "ops": ops,
+                        }
+                        if literal:
+                            zf.writestr(LITERALS_DIR + arcname, literal)
+                        done += size
+                        if progress_callback:
+                            progress_callback(done, total)
+                        continue
+
+                compress_type, level = zipfile.ZIP_DEFLATED, compresslevel
+                if adaptive and size:
+                    compress_type, level = choose_compression(path, size, compresslevel)
+                if arcname.endswith("/"):
+                    zf.write(path, arcname)
+                else:
+                    hashes[arcname] = write_hashed(zf, path, arcname, compress_type, level)
+                done += size
+                if progress_callback:
+                    progress_callback(done, total)
+
+            zf.writestr(DELTA_META, json.dumps(meta))
+            zf.writestr(MANIFEST_MEMBER, manifest_data(hashes))
+
+    return out.size, out.hash.hexdigest()
+
+
+# ===================== LEITURA =====================
+
+def _read_meta(zf):
+    try:
+        return json.loads(zf.read(DELTA_META))
+    except KeyError:
+        raise ValueError("Delta metadata missing")
+
+
+def delta_base(path):
+    """Nome da base de um delta (para a retenção não apagá-la)."""
+    with zipfile.ZipFile(path) as zf:
+        return _read_meta(zf).get("base")
+
+
+def list_delta_groups(path, depth=1):
+    """Entradas do delta agrupadas até `depth` níveis: [(entrada, bytes)]."""
+    sizes = {}
+    with zipfile.ZipFile(path) as zf:
+        meta = _read_meta(zf)
+        for info in zf.infolist():
+            if is_metadata(info.filename):
+                continue
+            group = group_of(info.filename, depth)
+            sizes[group] = sizes.get(group, 0) + info.file_size
+        for arcname, entry in meta["files"].items():
+            group = group_of(arcname, depth)
+            sizes[group] = sizes.get(group, 0) + entry["size"]
+    return sorted(sizes.items())
+
+
+def _same_file(target, entry):
+    if local_size(target) != entry["size"]:
+        return False
+    digest = hashlib.blake2b()
+    with open(target, "rb") as f:
+        while True:
+            chunk = f.read(EXTRACT_BUFFER)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest() == entry["hash"]
+
+
+def restore_delta(path, dest_dir, progress_callback=None, members=None, stats=None):
+    """
+    Restaura um delta sobre dest_dir: os membros normais são extraídos e os
+    arquivos em delta são refeitos a partir da base (na mesma pasta) e
+    conferidos pelo hash. stats (ExtractStats) pula o que já está igual no
+    disco, sem nem ler a base. Retorna a quantidade de membros restaurados.
+    """
+    dest_root = os.path.abspath(dest_dir)
+    with open(path, "rb", buffering=EXTRACT_BUFFER) as raw, zipfile.ZipFile(raw) as zf:
+        meta = _read_meta(zf)
+        base_path = os.path.join(os.path.dirname(path), meta.get("base") or "")
+        if not meta.get("base") or not os.path.isfile(base_path):
+            raise ValueError(f"Base backup missing: {meta.get('base')}")
+
+        plain = [
+            info for info in zf.infolist()
+            if not is_metadata(info.filename) and is_selected(info.filename, members)
+        ]
+        rebuilt = {arcname: entry for arcname, entry in meta["files"].items() if is_selected(arcname, members)}
+        total = sum(info.file_size for info in plain) + sum(entry["size"] for entry in rebuilt.values())
+        done = 0
+
+        for info in plain:
+            extract_member(zf, info, dest_root, stats)
+            done += info.file_size
+            if progress_callback:
+                progress_callback(done, total)
+
+        if rebuilt:
+            with zipfile.ZipFile(base_path) as base_zf:
+                block_sizes = json.loads(base_zf.read(SIGNATURES_MEMBER))["files"]
+                for arcname, entry in rebuilt.items():
+                    target = _member_target(dest_root, arcname)
+                    if stats and stats.compare and _same_file(target, entry):
+                        stats.add(entry["size"], written=False)
+                        done += entry["size"]
+                        if progress_callback:
+                            progress_callback(done, total)
+                        continue
+                    if arcname not in block_sizes:
+                        raise ValueError(f"Base backup has no signature for {arcname}")
+                    base = base_zf.read(arcname)
+                    block = block_sizes[arcname]["block"]
+                    literal_name = LITERALS_DIR + arcname
+                    if literal_name in zf.NameToInfo:
+                        with zf.open(literal_name) as literals:
+                            data = apply_delta(base, entry["ops"], literals, block)
+                    else:
+                        data = apply_delta(base, entry["ops"], None, block)
+                    # Conferido antes de gravar: um delta ruim não estraga o save local
+                    if _file_hash(data) != entry["hash"]:
+                        raise ValueError(f"Delta reconstruction mismatch: {arcname}")
+
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with publishing(target, durable=False) as dst:
+                        dst.write(data)
+                    os.utime(target, (entry["mtime"], entry["mtime"]))
+                    if stats:
+                        stats.add(entry["size"], written=True)
+
+                    done += entry["size"]
+                    if progress_callback:
+                        progress_callback(done, total)
+
+    return len(plain) + len(rebuilt)
@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import time
+import threading
+
+# ===================== TRADUÇÕES (CACHE) =====================
+# Antes, cada tr() abria e decodificava config.json e locales/<idioma>.json.
+# Agora o dicionário fica em memória e só é recarregado quando o mtime de um
+# dos dois arquivos muda (verificado no máximo uma vez por segundo) ou quando
+# o idioma é trocado explicitamente com load_language().
+
+CONFIG_FILE = "config.json"
+# Ao lado do programa, não da pasta de trabalho (a CLI roda na pasta do config)
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales")
+DEFAULT_LANGUAGE = "EN"
+
+# Intervalo mínimo entre verificações de mtime (segundos)
+CHECK_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_state = {
+    "language": None,
+    "translations": {},
+    "config_mtime": None,
+    "locale_mtime": None,
+    "checked_at": None,
+}
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _language_from_config():
+    try:
+        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+            return json.load(f).get("language", DEFAULT_LANGUAGE)
+    except Exception:
+        return DEFAULT_LANGUAGE
+
+
+def _load_locale(language):
+    locale_path = os.path.join(LOCALES_DIR, f"{language}.json")
+    try:
+        with open(locale_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        # stderr: a saída --json da CLI tem que continuar sendo JSON
+        print(f"Não foi possível carregar traduções de {locale_path}: {e}", file=sys.stderr)
+        return {}
+
+
+def _refresh():
+    """Recarrega idioma/traduções se config.json ou o locale mudaram. Chamar com _lock."""
+    config_mtime = _mtime(CONFIG_FILE)
+    language = _state["language"]
+    if language is None or config_mtime != _state["config_mtime"]:
+        language = _language_from_config()
+        _state["config_mtime"] = config_mtime
+
+    locale_mtime = _mtime(os.path.join(LOCALES_DIR, f"{language}.json"))
+    if language != _state["language"] or locale_mtime != _state["locale_mtime"]:
+        _state["translations"] = _load_locale(language)
+        _state["language"] = language
+        _state["locale_mtime"] = locale_mtime
+
+    _state["checked_at"] = time.monotonic()
+
+
+def get_translations():
+    """Dicionário de traduções do idioma atual (em cache)."""
+    checked_at = _state["checked_at"]
+    if checked_at is None or time.monotonic() - checked_at >= CHECK_INTERVAL:
+        with _lock:
+            _refresh()
+    return _state["translations"]
+
+
+def get_language():
+    """Código do idioma atual"""
+    get_translations()
+    return _state["language"]
+
+
+def load_language(lang_code):
+    """Troca o idioma explicitamente (ex.: dropdown da interface)."""
+    with _lock:
+        _state["translations"] = _load_locale(lang_code)
+        _state["language"] = lang_code
+        _state["locale_mtime"] = _mtime(os.path.join(LOCALES_DIR, f"{lang_code}.json"))
+        # O config.json atual não deve sobrescrever a escolha; só uma alteração futura
+        _state["config_mtime"] = _mtime(CONFIG_FILE)
+        _state["checked_at"] = time.monotonic()
+
+
+def invalidate():
+    """Força recarregar tudo na próxima chamada."""
+    with _lock:
+        _state["language"] = None
+        _state["checked_at"] = None
+
+
+def tr(key, **kwargs):
+    """Tradução da chave com parâmetros nomeados (usado em backup/restore)."""
+    text = get_translations().get(key, key)
+    if kwargs:
+        return text.format(**kwargs)
+    return text
+
+
+def t(key, *args):
+    """Retorna o texto traduzido, usa key como fallback se não existir"""
+    text = get_translations().get(key, key)
+    if args:
+        try:
+            text = text.format(*args)
+        except Exception:
+            pass
+    return text
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from utils import backup_timestamp
+
+# ===================== MEDIÇÃO POR FASE =====================
+# Cada backup/restauração registra quanto tempo, quantos bytes e quantos
+# arquivos cada fase levou (scan, compress, publish, cleanup, lookup,
+# extract) num log JSON-lines (logs/run_log.jsonl), uma linha por evento.
+# Com profiling ligado, a execução inteira roda sob cProfile e o resultado
+# vai para logs/<tipo>_<timestamp>.pstats.
+# Fora de um run() ativo, phase() não grava nada e custa quase zero.
+
+LOG_DIR = "logs"
+LOG_FILE = "run_log.jsonl"
+
+_lock = threading.Lock()
+_state = {
+    "run_id": None,
+    "log": None,
+    "profiles": None,
+}
+
+
+class PhaseRecord:
+    """Contadores preenchidos pela fase enquanto ela roda."""
+
+    def __init__(self):
+        self.bytes = 0
+        self.files = 0
+        self.output_bytes = None
+
+
+def _emit(record):
+    with _lock:
+        log = _state["log"]
+        if log is None:
+            return
+        record = dict(record, run_id=_state["run_id"])
+        log.write(json.dumps(record, ensure_ascii=False) + "\n")
+        log.flush()
+
+
+@contextmanager
+def run(kind, log=True, profile=False):
+    """
+    Delimita uma execução (ex.: "backup", "restore"). log grava os eventos
+    em logs/run_log.jsonl; profile liga o cProfile em cada unidade.
+    """
+    stamp = backup_timestamp()
+    pstats_path = None
+    with _lock:
+        _state["run_id"] = f"{kind}_{stamp}"
+        if log or profile:
+            os.makedirs(LOG_DIR, exist_ok=True)
+        if log:
+            _state["log"] = open(os.path.join(LOG_DIR, LOG_FILE), "a", encoding="utf-8")
+        if profile:
+            _state["profiles"] = []
+            pstats_path = os.path.join(LOG_DIR, f"{kind}_{stamp}.pstats")
+
+    _emit({"event": "run_start", "kind": kind, "time": datetime.now().isoformat(timespec="seconds")})
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _emit({
+            "event": "run_end",
+            "kind": kind,
+            "seconds": round(time.perf_counter() - start, 4),
+            "pstats": pstats_path,
+        })
+        with _lock:
+            profiles = _state["profiles"]
+            if _state["log"] is not None:
+                _state["log"].close()
+            _state.update(run_id=None, log=None, profiles=None)
+
+        if profiles:
+            import pstats
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(pstats_path)
+
+
+def profiling():
+    """True dentro de um run(profile=True)."""
+    return _state["profiles"] is not None
+
+
+def profile_call(func, *args, **kwargs):
+    """
+    Chama func; com profiling ativo, sob um cProfile próprio da thread
+    (o cProfile só enxerga a thread onde foi ligado) que é somado aos demais
+    no fim do run(). No Python 3.12+ só um cProfile pode estar ligado por
+    vez: por isso run_units roda uma unidade de cada vez durante o profiling,
+    e se mesmo assim outro estiver ativo a unidade roda sem medição.
+    """
+    if _state["profiles"] is None:
+        return func(*args, **kwargs)
+
+    # Importado só aqui: pstats/cProfile pesam na partida e quase nunca são usados
+    import cProfile
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # "Another profiling tool is already active"
+        return func(*args, **kwargs)
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        profile.disable()
+    # Só perfis que rodaram até o fim entram na soma
+    with _lock:
+        if _state["profiles"] is not None:
+            _state["profiles"].append(profile)
+    return result
+
+
+@contextmanager
+def phase(unit, name):
+    """
+    Mede uma fase de uma unidade. O bloco pode preencher record.bytes,
+    record.files e record.output_bytes.
+    """
+    record = PhaseRecord()
+    if _state["run_id"] is None:
+        yield record
+        return
+
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield record
+        ok = True
+    finally:
+        event = {
+            "event": "phase",
+            "unit": unit,
+            "phase": name,
+            "seconds": round(time.perf_counter() - start, 4),
+            "bytes": record.bytes,
+            "files": record.files,
+            "ok": ok,
+        }
+        if record.output_bytes is not None:
+            event["output_bytes"] = record.output_bytes
+        _emit(event)
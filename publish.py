@@ -0,0 +1,127 @@
+import os
+import re
+import time
+import threading
+import itertools
+from contextlib import contextmanager
+
+# ===================== PUBLICAÇÃO ATÔMICA =====================
+# Tudo o que vai para a pasta sincronizada (backups, manifestos, blocos do
+# repositório, catálogo) é gravado primeiro num nome oculto
+# (.<nome>.<pid>-<n>.partial), sincronizado no disco (fsync) e só então
+# renomeado para o nome final com os.replace, que é atômico. Assim o Google
+# Drive nunca vê (nem envia) um arquivo pela metade e uma queda no meio do
+# backup não deixa um zip truncado com cara de "mais recente".
+# Parciais de execuções que caíram são apagados depois de STALE_SECONDS,
+# no máximo uma vez por STALE_SECONDS em cada pasta (listar a pasta do Drive
+# é caro) e só os de nomes que o chamador reconhece como seus.
+# A restauração usa o mesmo caminho (sem fsync) para nunca escrever por cima
+# de um save existente: o arquivo antigo só é trocado pelo novo já completo,
+# e um hardlink dele (ver rollback.py) continua com o conteúdo antigo.
+
+PARTIAL_SUFFIX = ".partial"
+STALE_SECONDS = 60 * 60
+
+_counter = itertools.count()
+
+# .<nome final>.<pid>-<n>.partial
+_PARTIAL_RE = re.compile(r"^\.(?P<name>.+)\.\d+-\d+" + re.escape(PARTIAL_SUFFIX) + "$")
+
+_clean_lock = threading.Lock()
+_last_clean = {}  # pasta → última limpeza (time.time())
+
+
+def partial_path(dest_path):
+    """Nome temporário oculto, na mesma pasta (rename atômico só vale no mesmo disco)."""
+    directory, name = os.path.split(dest_path)
+    return os.path.join(directory, f".{name}.{os.getpid()}-{next(_counter)}{PARTIAL_SUFFIX}")
+
+
+def fsync_dir(directory):
+    """Garante que o rename foi para o disco. No Windows não há fsync de pasta."""
+    if os.name != "posix":
+        return
+    fd = os.open(directory or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def publishing(dest_path, durable=True):
+    """
+    Abre o parcial de dest_path para escrita binária. Se o bloco terminar sem
+    erro, o arquivo é sincronizado e renomeado para dest_path; se falhar, o
+    parcial é apagado e dest_path fica como estava.
+    Com durable=False não há fsync (restauração de muitos arquivos pequenos).
+    """
+    tmp_path = partial_path(dest_path)
+    try:
+        with open(tmp_path, "wb") as f:
+            yield f
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    if durable:
+        fsync_dir(os.path.dirname(dest_path))
+
+
+def write_atomic(path, data):
+    """Grava bytes em path pelo mesmo caminho (parcial + fsync + rename)."""
+    with publishing(path) as f:
+        f.write(data)
+
+
+def partial_target(name):
+    """Nome final de um parcial gerado por partial_path, ou None se name não for um."""
+    match = _PARTIAL_RE.match(name)
+    return match.group("name") if match else None
+
+
+def is_partial(name):
+    return partial_target(name) is not None
+
+
+def clean_stale_partials(directory, owns, max_age=STALE_SECONDS, now=None):
+    """
+    Apaga os parciais de directory cujo nome final satisfaz owns(nome) e que
+    têm mais de max_age segundos (os mais novos podem ser de um backup em
+    andamento, inclusive de outro PC). Se a pasta já foi limpa há menos de
+    max_age segundos neste processo, não lista de novo: nenhum parcial teria
+    envelhecido o bastante. Retorna quantos apagou.
+    """
+    now = time.time() if now is None else now
+    key = os.path.abspath(directory)
+    with _clean_lock:
+        last = _last_clean.get(key)
+        if last is not None and now - last < max_age:
+            return 0
+        _last_clean[key] = now
+
+    removed = 0
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return 0
+    for entry in entries:
+        target = partial_target(entry.name)
+        if target is None or not owns(target) or not entry.is_file(follow_symlinks=False):
+            continue
+        try:
+            if now - entry.stat().st_mtime < max_age:
+                continue
+            os.remove(entry.path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
@@ -1,198 +1,218 @@
 import os
-import shutil
-import subprocess
-from utils import find_compressor
-import json
-
-# ===================== LOCALE DINÂMICO =====================
-def get_translations():
-    """Carrega o idioma atual do config.json e retorna o dicionário de traduções."""
-    language = "EN"  # padrão
-    try:
-        with open("config.json", "r", encoding="utf-8") as f:
-            config = json.load(f)
-            language = config.get("language", language)
-    except Exception:
-        pass
-
-    translations = {}
-    locale_path = os.path.join("locales", f"{language}.json")
-    try:
-        with open(locale_path, "r", encoding="utf-8") as f:
-            translations = json.load(f)
-    except Exception as e:
-        print(f"Não foi possível carregar traduções de {locale_path}: {e}")
-    return translations
-
-def tr(key, **kwargs):
-    """Retorna a tradução atual da chave, recarregando o idioma se necessário."""
-    translations = get_translations()
-    text = translations.get(key, key)
-    if kwargs:
-        return text.format(**kwargs)
-    return text
+from archiver import ExtractStats
+from archive_formats import extract_archive, list_archive_groups, ARCHIVE_ERRORS
+from catalog import latest_backup
+from snapshot_store import restore_snapshot, list_snapshot_groups, SNAPSHOT_SUFFIX
+from delta import restore_delta, list_delta_groups, DELTA_SUFFIX
+from rollback import (
+    snapshot_before_restore, record_after_restore, changed_since_restore, pending_rollbacks, undo_restore,
+    new_run_id, DEFAULT_MAX_DAYS,
+)
+from instrumentation import phase
+from utils import parse_backup_name, format_size
+from i18n import tr
 
 # ===================== FUNÇÕES DE RESTAURAÇÃO =====================
 
-def restore_ppsspp(ppsspp_path, sync_dir, progress_callback=None):
-    def progress(percent, message=None):
-        if progress_callback:
-            progress_callback(percent, message)
+def restore_options(config):
+    """
+    Opções de restauração (repassadas às funções restore_*) a partir do config.
+    Chamar uma vez por execução: todas as unidades dela levam o mesmo run_id.
+    """
+    return {
+        "rollback": config.get("restore_rollback", True),
+        "rollback_days": config.get("restore_rollback_days", DEFAULT_MAX_DAYS),
+        "run_id": new_run_id(),
+        "differential": config.get("restore_differential", True),
+    }
+
+
+# Quantos níveis formam a pasta de um jogo dentro do backup de cada unidade.
+# Citra: Nintendo 3DS/<id0>/<id1>/title/<tid alto>/<tid baixo>
+GROUP_DEPTH = {
+    "CITRA_SDMC": 6,
+}
+
+
+def list_backup_entries(sync_dir, unit):
+    """
+    Entradas (jogos) do backup mais recente da unidade, para restauração seletiva.
+    Retorna (nome_do_backup, [(entrada, bytes)]) ou (None, []) se não houver backup.
+    """
+    backup_name = latest_backup(sync_dir, unit)
+    if not backup_name:
+        return None, []
+
+    depth = GROUP_DEPTH.get(unit, 1)
+    backup_path = os.path.join(sync_dir, backup_name)
+    if backup_name.endswith(SNAPSHOT_SUFFIX):
+        return backup_name, list_snapshot_groups(backup_path, depth)
+    if backup_name.endswith(DELTA_SUFFIX):
+        return backup_name, list_delta_groups(backup_path, depth)
+    return backup_name, list_archive_groups(backup_path, depth)
+
+
+def _restore_backup(backup_name, sync_dir, dest_dir, progress, name=None, members=None, rollback=True,
+                    rollback_days=DEFAULT_MAX_DAYS, run_id=None, differential=True):
+    """
+    Restaura backup_name (zip, tar.*, delta ou snapshot) sobre dest_dir, lendo direto da
+    pasta sincronizada. name é usado nas mensagens dos backups extras.
+    members limita a restauração a algumas entradas (ver list_backup_entries).
+    Com rollback=True o estado atual de dest_dir é guardado antes (ver
+    rollback.py); sem essa cópia a restauração não acontece. run_id agrupa
+    as unidades da mesma execução para desfazer.
+    Com differential=True os arquivos que já estão iguais no disco não são
+    regravados (ver ExtractStats).
+    """
+    backup_sync_path = os.path.join(sync_dir, backup_name)
+    unit = (parse_backup_name(backup_name) or (backup_name,))[0]
+
+    rollback_entry = None
+    if rollback:
+        try:
+            with phase(unit, "rollback"):
+                rollback_entry = snapshot_before_restore(unit, dest_dir, backup_name, run_id, rollback_days)
+        except OSError as e:
+            progress(0, tr("rollback_error", detail=e))
+            return False, tr("rollback_error", detail=e)
+
+    stats = ExtractStats(compare=differential)
+    progress(30, tr("extracting_backup_name", name=name) if name else tr("extracting_backup"))
+    try:
+        with phase(unit, "extract") as record:
+            def on_bytes(done, total):
+                record.bytes = done
+                # 30% → 95% proporcional aos bytes já extraídos
+                if total:
+                    progress(30 + 65 * done / total, done=done, total=total)
+
+            if backup_name.endswith(SNAPSHOT_SUFFIX):
+                record.files = restore_snapshot(backup_sync_path, sync_dir, dest_dir, progress_callback=on_bytes,
+                                                members=members, stats=stats)
+            elif backup_name.endswith(DELTA_SUFFIX):
+                record.files = restore_delta(backup_sync_path, dest_dir, progress_callback=on_bytes, members=members, stats=stats)
+            else:
+                record.files = extract_archive(backup_sync_path, dest_dir, progress_callback=on_bytes, members=members, stats=stats)
+            record.output_bytes = stats.written_bytes
+    except ARCHIVE_ERRORS as e:
+        if rollback_entry:
+            record_after_restore(unit, rollback_entry["snapshot"])
+        if name:
+            progress(0, tr("error_extracting_detail_name", name=name, detail=e))
+            return False, tr("error_extracting_detail_name", name=name, detail=e)
+        progress(0, tr("error_extracting"))
+        return False, tr("error_extracting_detail", detail=e)
 
-    memstick_psp = os.path.join(ppsspp_path, "memstick", "PSP")
-    direct_psp = os.path.join(ppsspp_path, "PSP")
+    if rollback_entry:
+        # Estado pós-restauração: desfazer percebe se o jogo gravou algo depois
+        record_after_restore(unit, rollback_entry["snapshot"])
 
-    if os.path.isdir(os.path.join(ppsspp_path, "memstick")):
-        psp_dir = memstick_psp
-    else:
-        psp_dir = direct_psp
+    progress(100, tr("restore_finished"))
+    summary = "\n" + tr(
+        "restore_summary",
+        written=stats.written, written_size=format_size(stats.written_bytes),
+        skipped=stats.skipped, skipped_size=format_size(stats.skipped_bytes),
+    )
+    if name:
+        return True, tr("restore_success_name", name=name, path=backup_name) + summary
+    return True, tr("restore_success", path=backup_name) + summary
+
+def pending_undo(units=None, max_days=DEFAULT_MAX_DAYS):
+    """
+    O que undo_last_restore desfaria: as unidades da restauração mais recente
+    (só as de units, se dado). Retorna [(prefixo, entrada, arquivos alterados
+    desde a restauração)].
+    """
+    return [
+        (unit, entry, changed_since_restore(entry))
+        for unit, entry in pending_rollbacks(max_days).items()
+        if units is None or unit in units
+    ]
 
-    savedata_dir = os.path.join(psp_dir, "SAVEDATA")
-    os.makedirs(savedata_dir, exist_ok=True)
 
-    backups = [
-        f for f in os.listdir(sync_dir)
-        if f.startswith("PPSSPP_SAVES_") and f.endswith(".zip")
-    ]
-    if not backups:
-        return False, tr("no_backup_found", emulator="PPSSPP")
+def undo_last_restore(units=None, force=False, max_days=DEFAULT_MAX_DAYS):
+    """
+    Desfaz a restauração mais recente (só as unidades de units, se dado).
+    Uma unidade cuja pasta mudou depois da restauração é recusada, a menos
+    que force=True (os arquivos novos seriam perdidos).
+    Retorna [(prefixo, sucesso, mensagem)].
+    """
+    results = []
+    for unit, entry, changed in pending_undo(units, max_days):
+        if changed and not force:
+            results.append((unit, False, tr("undo_changed", name=unit, count=len(changed),
+                                            files=", ".join(changed[:3]))))
+            continue
+        try:
+            undo_restore(unit)
+        except OSError as e:
+            results.append((unit, False, tr("undo_error", name=unit, detail=e)))
+        else:
+            results.append((unit, True, tr("undo_success", name=unit, path=entry["target"])))
+    return results
 
-    backups.sort(reverse=True)
-    zip_name = backups[0]
-    zip_sync_path = os.path.join(sync_dir, zip_name)
+# =======================================================
 
-    progress(30, tr("copying_backup"))
-    zip_local_path = os.path.join(psp_dir, zip_name)
-    shutil.copy2(zip_sync_path, zip_local_path)
+def restore_ppsspp(ppsspp_path, sync_dir, progress_callback=None, members=None, **options):
+    def progress(percent, message=None, **counters):
+        if progress_callback:
+            progress_callback(percent, message, **counters)
 
-    tool, exe = find_compressor()
-    if not exe:
-        return False, tr("compressor_not_found")
+    if os.path.isdir(os.path.join(ppsspp_path, "memstick")):
+        psp_dir = os.path.join(ppsspp_path, "memstick", "PSP")
+    else:
+        psp_dir = os.path.join(ppsspp_path, "PSP")
 
-    progress(50, tr("extracting_backup"))
-    try:
-        if tool == "winrar":
-            cmd = [exe, "x", "-y", zip_local_path, savedata_dir]
-        else:
-            cmd = [exe, "x", "-y", zip_local_path, f"-o{savedata_dir}"]
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as e:
-        progress(0, tr("error_extracting"))
-        return False, tr("error_extracting_detail", detail=e)
+    savedata_dir = os.path.join(psp_dir, "SAVEDATA")
+    os.makedirs(savedata_dir, exist_ok=True)
 
-    progress(90, tr("removing_temp_file"))
-    try:
-        os.remove(zip_local_path)
-    except Exception:
-        pass
+    with phase("PPSSPP_SAVES", "lookup"):
+        backup_name = latest_backup(sync_dir, "PPSSPP_SAVES")
+    if not backup_name:
+        return False, tr("no_backup_found", emulator="PPSSPP")
 
-    progress(100, tr("restore_finished"))
-    return True, tr("restore_success", path=zip_name)
+    return _restore_backup(backup_name, sync_dir, savedata_dir, progress, members=members, **options)
 
 # =======================================================
 
-def restore_pcsx2(pcsx2_path, sync_dir, progress_callback=None):
-    def progress(percent, message=None):
+def restore_pcsx2(pcsx2_path, sync_dir, progress_callback=None, members=None, **options):
+    def progress(percent, message=None, **counters):
         if progress_callback:
-            progress_callback(percent, message)
+            progress_callback(percent, message, **counters)
 
     memcards_dir = os.path.join(pcsx2_path, "memcards")
     os.makedirs(memcards_dir, exist_ok=True)
 
-    backups = [
-        f for f in os.listdir(sync_dir)
-        if f.startswith("PCSX2_MEMCARDS_") and f.endswith(".zip")
-    ]
-    if not backups:
+    with phase("PCSX2_MEMCARDS", "lookup"):
+        backup_name = latest_backup(sync_dir, "PCSX2_MEMCARDS")
+    if not backup_name:
         return False, tr("no_backup_found", emulator="PCSX2")
 
-    backups.sort(reverse=True)
-    zip_name = backups[0]
-    zip_sync_path = os.path.join(sync_dir, zip_name)
-
-    progress(30, tr("copying_backup"))
-    zip_local_path = os.path.join(pcsx2_path, zip_name)
-    shutil.copy2(zip_sync_path, zip_local_path)
-
-    tool, exe = find_compressor()
-    if not exe:
-        return False, tr("compressor_not_found")
-
-    progress(50, tr("extracting_backup"))
-    try:
-        if tool == "winrar":
-            cmd = [exe, "x", "-y", zip_local_path, memcards_dir]
-        else:
-            cmd = [exe, "x", "-y", zip_local_path, f"-o{memcards_dir}"]
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as e:
-        progress(0, tr("error_extracting"))
-        return False, tr("error_extracting_detail", detail=e)
-
-    progress(90, tr("removing_temp_file"))
-    try:
-        os.remove(zip_local_path)
-    except Exception:
-        pass
-
-    progress(100, tr("restore_finished"))
-    return True, tr("restore_success", path=zip_name)
+    return _restore_backup(backup_name, sync_dir, memcards_dir, progress, members=members, **options)
 
 # =======================================================
 
-def restore_citra(citra_path, sync_dir, progress_callback=None):
-    def progress(percent, message=None):
+def restore_citra(citra_path, sync_dir, progress_callback=None, members=None, **options):
+    def progress(percent, message=None, **counters):
         if progress_callback:
-            progress_callback(percent, message)
+            progress_callback(percent, message, **counters)
 
     sdmc_dir = os.path.join(citra_path, "sdmc")
     os.makedirs(sdmc_dir, exist_ok=True)
 
-    backups = [
-        f for f in os.listdir(sync_dir)
-        if f.startswith("CITRA_SDMC_") and f.endswith(".zip")
-    ]
-    if not backups:
+    with phase("CITRA_SDMC", "lookup"):
+        backup_name = latest_backup(sync_dir, "CITRA_SDMC")
+    if not backup_name:
         return False, tr("no_backup_found", emulator="CITRA")
 
-    backups.sort(reverse=True)
-    zip_name = backups[0]
-    zip_sync_path = os.path.join(sync_dir, zip_name)
-
-    progress(30, tr("copying_backup"))
-    zip_local_path = os.path.join(citra_path, zip_name)
-    shutil.copy2(zip_sync_path, zip_local_path)
-
-    tool, exe = find_compressor()
-    if not exe:
-        return False, tr("compressor_not_found")
-
-    progress(50, tr("extracting_backup"))
-    try:
-        if tool == "winrar":
-            cmd = [exe, "x", "-y", zip_local_path, sdmc_dir]
-        else:
-            cmd = [exe, "x", "-y", zip_local_path, f"-o{sdmc_dir}"]
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as e:
-        progress(0, tr("error_extracting"))
-        return False, tr("error_extracting_detail", detail=e)
-
-    progress(90, tr("removing_temp_file"))
-    try:
-        os.remove(zip_local_path)
-    except Exception:
-        pass
-
-    progress(100, tr("restore_finished"))
-    return True, tr("restore_success", path=zip_name)
+    return _restore_backup(backup_name, sync_dir, sdmc_dir, progress, members=members, **options)
 
 # =======================================================
 
-def restore_custom_dir(dir_entry, sync_dir, progress_callback=None):
-    def progress(percent, message=None):
+def restore_custom_dir(dir_entry, sync_dir, progress_callback=None, members=None, **options):
+    def progress(percent, message=None, **counters):
         if progress_callback:
-            progress_callback(percent, message)
+            progress_callback(percent, message, **counters)
 
     name = dir_entry.get("name")
     root_path = dir_entry.get("root_path")
@@ -205,41 +225,9 @@ def restore_custom_dir(dir_entry, sync_dir, progress_callback=None):
 
     safe_name = name.replace(" ", "_")
 
-    backups = [
-        f for f in os.listdir(sync_dir)
-        if f.startswith(f"{safe_name}_") and f.endswith(".zip")
-    ]
-    if not backups:
+    with phase(safe_name, "lookup"):
+        backup_name = latest_backup(sync_dir, safe_name)
+    if not backup_name:
         return False, tr("no_backup_found", emulator=name)
 
-    backups.sort(reverse=True)
-    zip_name = backups[0]
-    zip_sync_path = os.path.join(sync_dir, zip_name)
-
-    progress(30, tr("copying_backup_name", name=name))
-    zip_local_path = os.path.join(root_path, zip_name)
-    shutil.copy2(zip_sync_path, zip_local_path)
-
-    tool, exe = find_compressor()
-    if not exe:
-        return False, tr("compressor_not_found")
-
-    progress(50, tr("extracting_backup_name", name=name))
-    try:
-        if tool == "winrar":
-            cmd = [exe, "x", "-y", zip_local_path, root_path]
-        else:
-            cmd = [exe, "x", "-y", zip_local_path, f"-o{root_path}"]
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as e:
-        progress(0, tr("error_extracting_detail_name", name=name, detail=e))
-        return False, tr("error_extracting_detail_name", name=name, detail=e)
-
-    progress(90, tr("removing_temp_file"))
-    try:
-        os.remove(zip_local_path)
-    except Exception:
-        pass
-
-    progress(100, tr("restore_finished"))
-    return True, tr("restore_success_name", name=name, path=zip_name)
+    return _restore_backup(backup_name, sync_dir, root_path, progress, name=name, members=members, **options)
@@ -0,0 +1,120 @@
+import os
+from datetime import timedelta
+
+from catalog import list_backups, remove_backups
+from snapshot_store import collect_garbage, SNAPSHOT_SUFFIX
+from delta import delta_base, DELTA_SUFFIX
+from archive_formats import ARCHIVE_ERRORS
+from utils import parse_backup_name
+
+# ===================== RETENÇÃO (AVÔ-PAI-FILHO) =====================
+# Mantém, por unidade:
+#   keep_last   → os N backups mais recentes
+#   keep_daily  → o mais recente de cada um dos últimos D dias
+#   keep_weekly → o mais recente de cada uma das últimas W semanas
+# Tudo o que não entra em nenhuma regra é apagado. Política vazia ou com
+# tudo zero desativa a retenção (nada é apagado). A base de um delta mantido
+# também fica, senão o delta não teria como ser restaurado.
+
+
+def policy_enabled(policy):
+    return bool(policy) and any(policy.get(k) for k in ("keep_last", "keep_daily", "keep_weekly"))
+
+
+def select_backups_to_keep(names, policy, now):
+    """
+    Escolhe quais backups (nomes no padrão <prefixo>_<timestamp>) ficam.
+    now é o datetime de referência para as regras diárias/semanais.
+    """
+    dated = []
+    for name in names:
+        parsed = parse_backup_name(name)
+        if parsed:
+            dated.append((parsed[1], name))
+    dated.sort(reverse=True)
+
+    keep = set(name for _, name in dated[:int(policy.get("keep_last") or 0)])
+
+    keep_daily = int(policy.get("keep_daily") or 0)
+    if keep_daily:
+        seen_days = set()
+        for stamp, name in dated:
+            if (now.date() - stamp.date()).days >= keep_daily:
+                break
+            if stamp.date() not in seen_days:
+                seen_days.add(stamp.date())
+                keep.add(name)
+
+    keep_weekly = int(policy.get("keep_weekly") or 0)
+    if keep_weekly:
+        seen_weeks = set()
+        this_monday = now.date() - timedelta(days=now.weekday())
+        for stamp, name in dated:
+            monday = stamp.date() - timedelta(days=stamp.weekday())
+            if (this_monday - monday).days // 7 >= keep_weekly:
+                break
+            if monday not in seen_weeks:
+                seen_weeks.add(monday)
+                keep.add(name)
+
+    return keep
+
+
+def _delta_bases(sync_dir, backups, keep):
+    """Bases dos deltas mantidos (pelo catálogo ou, se faltar, lendo o delta)."""
+    bases = set()
+    for name, entry in backups:
+        if name not in keep or not name.endswith(DELTA_SUFFIX):
+            continue
+        base = entry.get("base")
+        if not base:
+            try:
+                base = delta_base(os.path.join(sync_dir, name))
+            except ARCHIVE_ERRORS:
+                continue
+        bases.add(base)
+    return bases
+
+
+def apply_retention(sync_dir, unit, policy, now, dry_run=False):
+    """
+    Aplica a política aos backups da unidade na pasta sincronizada.
+    Retorna (nomes apagados, bytes liberados); com dry_run nada é apagado
+    e o retorno diz o que seria.
+    """
+    if not policy_enabled(policy):
+        return [], 0
+
+    backups = list_backups(sync_dir, unit)
+    keep = select_backups_to_keep([name for name, _ in backups], policy, now)
+    keep |= _delta_bases(sync_dir, backups, keep)
+    doomed = [(name, entry) for name, entry in backups if name not in keep]
+    if not doomed:
+        return [], 0
+
+    reclaimed = 0
+    deleted = []
+    for name, entry in doomed:
+        path = os.path.join(sync_dir, name)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = entry.get("size") or 0
+        if not dry_run:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        reclaimed += size
+        deleted.append(name)
+
+    if not dry_run:
+        remove_backups(sync_dir, deleted)
+
+    # Snapshots apagados podem deixar blocos do repositório sem uso
+    snapshots = [name for name in deleted if name.endswith(SNAPSHOT_SUFFIX)]
+    if snapshots:
+        _, chunk_bytes = collect_garbage(sync_dir, exclude=set(snapshots), dry_run=dry_run)
+        reclaimed += chunk_bytes
+
+    return deleted, reclaimed
@@ -0,0 +1,331 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import threading
+from datetime import datetime
+
+from publish import partial_path, write_atomic, is_partial
+from utils import backup_timestamp
+
+# ===================== PONTO DE RETORNO DA RESTAURAÇÃO =====================
+# Antes de restaurar uma unidade, a pasta de destino (SAVEDATA, memcards,
+# sdmc ou a pasta do extra) é copiada para uma pasta irmã
+# .msb_rollback/<prefixo>_<timestamp> (se o destino for a raiz de um disco,
+# para .msb_rollback na pasta do programa). A "cópia" usa o método mais barato que
+# o sistema de arquivos aceitar:
+#   reflink  → FICLONE (Btrfs, XFS, bcachefs...): blocos compartilhados com
+#              cópia na escrita, custo quase zero
+#   hardlink → mesmo arquivo com dois nomes; seguro porque a restauração
+#              troca os arquivos por os.replace em vez de escrever por cima
+#   cópia    → último recurso
+# Fica só o ponto de retorno mais recente de cada unidade, registrado em
+# rollback_state.json; undo_restore() devolve a pasta a esse estado.
+#
+# Cada restauração (o botão, ou python -m cli restore) tem um id de execução
+# e desfazer só age nas unidades da execução mais recente. Depois de
+# restaurar, o tamanho/mtime de cada arquivo do destino fica registrado:
+# se a pasta mudou desde então (o jogo gravou um save novo), desfazer recusa
+# a unidade, a menos que seja forçado. Pontos de retorno com mais de
+# max_days dias são apagados.
+
+ROLLBACK_DIR = ".msb_rollback"
+STATE_FILE = "rollback_state.json"
+DEFAULT_MAX_DAYS = 7
+
+# ioctl FICLONE do Linux (_IOW(0x94, 9, int))
+FICLONE = 0x40049409
+
+_lock = threading.Lock()
+
+
+def load_rollback_state():
+    try:
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except Exception:
+        return {"units": {}}
+    if not isinstance(state.get("units"), dict):
+        return {"units": {}}
+    return state
+
+
+def save_rollback_state(state):
+    write_atomic(STATE_FILE, json.dumps(state, indent=1, ensure_ascii=False).encode("utf-8"))
+
+
+def _reflink(src, dst):
+    import fcntl
+
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    shutil.copystat(src, dst)
+
+
+def _hardlink(src, dst):
+    os.link(src, dst)
+
+
+def _copy(src, dst):
+    shutil.copy2(src, dst)
+
+
+class _Cloner:
+    """
+    Clona arquivos pelo primeiro método que funcionar. Quando um método falha
+    (sistema sem reflink, disco sem hardlink), os arquivos seguintes já
+    começam pelo próximo.
+    """
+
+    METHODS = (("reflink", _reflink), ("hardlink", _hardlink), ("copy", _copy))
+
+    def __init__(self):
+        # FICLONE só existe no Linux
+        self.index = 0 if sys.platform.startswith("linux") else 1
+
+    @property
+    def method(self):
+        return self.METHODS[self.index][0]
+
+    def clone(self, src, dst):
+        while True:
+            name, func = self.METHODS[self.index]
+            try:
+                func(src, dst)
+                return
+            except (OSError, ImportError):
+                if name == "copy":
+                    raise
+                try:
+                    os.remove(dst)
+                except OSError:
+                    pass
+                self.index += 1
+
+
+def new_run_id():
+    """Id de uma execução de restauração (todas as unidades restauradas juntas)."""
+    return uuid.uuid4().hex[:12]
+
+
+def _tree(root):
+    """
+    Arquivos e pastas de root (caminhos relativos), sem parciais de gravação
+    e sem pastas .msb_rollback (de outra unidade cujo destino fica dentro de root).
+    """
+    files, dirs = [], []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames if name != ROLLBACK_DIR)
+        rel_dir = os.path.relpath(dirpath, root)
+        if rel_dir != ".":
+            dirs.append(rel_dir)
+        for name in sorted(filenames):
+            if not is_partial(name):
+                files.append(os.path.normpath(os.path.join(rel_dir, name)))
+    return files, dirs
+
+
+def _files_state(root):
+    """{caminho relativo: [tamanho, mtime_ns]} dos arquivos de root."""
+    files, _ = _tree(root) if os.path.isdir(root) else ([], [])
+    state = {}
+    for rel in files:
+        try:
+            st = os.stat(os.path.join(root, rel))
+        except OSError:
+            continue
+        state[rel] = [st.st_size, st.st_mtime_ns]
+    return state
+
+
+def _remove_snapshot(path):
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rmdir(os.path.dirname(path))
+    except OSError:
+        pass
+
+
+def _is_inside(path, folder):
+    try:
+        return os.path.normcase(os.path.commonpath([path, folder])) == os.path.normcase(folder)
+    except ValueError:
+        # Discos diferentes no Windows
+        return False
+
+
+def _rollback_root(target):
+    """Pasta .msb_rollback para target, sempre fora dele."""
+    parent = os.path.dirname(target)
+    if parent == target:
+        # Raiz de um disco (E:\, /): não há pasta irmã
+        root = os.path.abspath(ROLLBACK_DIR)
+    else:
+        root = os.path.join(parent, ROLLBACK_DIR)
+    if _is_inside(root, target):
+        raise OSError(f"No place outside {target} to keep the rollback copy")
+    return root
+
+
+def _expire(state, max_days):
+    """Descarta (e apaga) pontos de retorno com mais de max_days dias. True se mudou algo."""
+    limit = time.time() - max_days * 86400
+    expired = [unit for unit, entry in state["units"].items() if entry.get("time", 0) < limit]
+    for unit in expired:
+        _remove_snapshot(state["units"].pop(unit)["snapshot"])
+    return bool(expired)
+
+
+def snapshot_before_restore(unit, target_dir, backup_name, run_id=None, max_days=DEFAULT_MAX_DAYS):
+    """
+    Guarda o estado atual de target_dir antes de restaurar backup_name e
+    substitui o ponto de retorno anterior da unidade. run_id agrupa as
+    unidades restauradas na mesma execução. Retorna a entrada gravada no
+    estado; se algo falhar a cópia parcial é apagada e o erro sobe.
+    """
+    target = os.path.abspath(target_dir)
+    base = os.path.join(_rollback_root(target), f"{unit}_{backup_timestamp()}")
+    snapshot = base
+    count = 1
+    while os.path.exists(snapshot):
+        count += 1
+        snapshot = f"{base}-{count}"
+    os.makedirs(snapshot)
+
+    cloner = _Cloner()
+    try:
+        files, dirs = _tree(target) if os.path.isdir(target) else ([], [])
+        for rel in dirs:
+            os.makedirs(os.path.join(snapshot, rel), exist_ok=True)
+        for rel in files:
+            cloner.clone(os.path.join(target, rel), os.path.join(snapshot, rel))
+    except BaseException:
+        _remove_snapshot(snapshot)
+        raise
+
+    entry = {
+        "target": target,
+        "snapshot": snapshot,
+        "backup": backup_name,
+        "run": run_id or new_run_id(),
+        "time": time.time(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "method": cloner.method,
+        "files": len(files),
+    }
+    with _lock:
+        state = load_rollback_state()
+        previous = state["units"].get(unit)
+        state["units"][unit] = entry
+        _expire(state, max_days)
+        save_rollback_state(state)
+    if previous and previous.get("snapshot") != snapshot:
+        _remove_snapshot(previous["snapshot"])
+    return entry
+
+
+def record_after_restore(unit, snapshot):
+    """Registra como target ficou depois da restauração (para changed_since_restore)."""
+    with _lock:
+        state = load_rollback_state()
+        entry = state["units"].get(unit)
+        if not entry or entry.get("snapshot") != snapshot:
+            return
+        entry["after"] = _files_state(entry["target"])
+        save_rollback_state(state)
+
+
+def changed_since_restore(entry):
+    """
+    Arquivos do destino criados, apagados ou alterados depois da restauração
+    (caminhos relativos). Sem registro do pós-restauração (restauração que
+    caiu no meio), nada é considerado alterado.
+    """
+    after = entry.get("after")
+    if after is None:
+        return []
+    now = _files_state(entry["target"])
+    changed = [rel for rel, st in now.items() if after.get(rel) != st]
+    changed += [rel for rel in after if rel not in now]
+    return sorted(changed)
+
+
+def pending_rollbacks(max_days=DEFAULT_MAX_DAYS):
+    """
+    Unidades da restauração mais recente que ainda pode ser desfeita:
+    {prefixo: entrada}. Pontos de retorno vencidos são apagados antes.
+    """
+    with _lock:
+        state = load_rollback_state()
+        if _expire(state, max_days):
+            save_rollback_state(state)
+    units = state["units"]
+    if not units:
+        return {}
+    latest = max(units.values(), key=lambda entry: entry.get("time", 0))
+    return {unit: entry for unit, entry in units.items() if entry.get("run") == latest.get("run")}
+
+
+def _put_back(src, dst):
+    """Move o arquivo do ponto de retorno para o destino (copia se estiverem em discos diferentes)."""
+    try:
+        os.replace(src, dst)
+    except OSError:
+        tmp_path = partial_path(dst)
+        try:
+            shutil.copy2(src, tmp_path)
+            os.replace(tmp_path, dst)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+def undo_restore(unit):
+    """
+    Devolve a pasta da unidade ao estado de antes da última restauração:
+    arquivos criados pela restauração são apagados e os antigos voltam.
+    O ponto de retorno é consumido.
+    """
+    with _lock:
+        entry = load_rollback_state()["units"].get(unit)
+    if not entry:
+        raise FileNotFoundError(f"No restore to undo for {unit}")
+    target, snapshot = entry["target"], entry["snapshot"]
+    if not os.path.isdir(snapshot):
+        raise FileNotFoundError(f"Rollback snapshot missing: {snapshot}")
+
+    files, dirs = _tree(snapshot)
+    keep_files = set(files)
+    keep_dirs = set(dirs)
+
+    # O que a restauração criou e não existia antes
+    if os.path.isdir(target):
+        for dirpath, dirnames, filenames in os.walk(target, topdown=False):
+            rel_dir = os.path.relpath(dirpath, target)
+            if ROLLBACK_DIR in rel_dir.split(os.sep):
+                continue
+            for name in filenames:
+                rel = os.path.normpath(os.path.join(rel_dir, name))
+                if rel not in keep_files:
+                    os.remove(os.path.join(dirpath, name))
+            if rel_dir != "." and rel_dir not in keep_dirs and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+
+    for rel in dirs:
+        os.makedirs(os.path.join(target, rel), exist_ok=True)
+    os.makedirs(target, exist_ok=True)
+    for rel in files:
+        _put_back(os.path.join(snapshot, rel), os.path.join(target, rel))
+
+    with _lock:
+        state = load_rollback_state()
+        if state["units"].get(unit, {}).get("snapshot") == snapshot:
+            del state["units"][unit]
+            save_rollback_state(state)
+    _remove_snapshot(snapshot)
+    return entry
@@ -0,0 +1,203 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from backup import backup_ppsspp, backup_pcsx2, backup_citra, backup_custom_dir, backup_options
+from restore import restore_ppsspp, restore_pcsx2, restore_citra, restore_custom_dir, restore_options
+from instrumentation import profile_call, profiling
+
+# ===================== EXECUÇÃO DAS UNIDADES =====================
+# Uma "unidade" é uma chamada independente de backup_*/restore_*.
+# As unidades rodam num pool de threads (a compactação com zlib e a
+# E/S de disco liberam o GIL) e os resultados voltam na ordem original.
+
+DEFAULT_MAX_WORKERS = 4
+
+
+def resolve_workers(value):
+    """Limite de workers do config; 0/None usa o número de núcleos."""
+    try:
+        value = int(value or 0)
+    except (TypeError, ValueError):
+        value = 0
+    if value <= 0:
+        value = os.cpu_count() or 1
+    return max(1, value)
+
+
+def backup_units(config, extras):
+    """Unidades de backup habilitadas: [(rótulo, prefixo, função, args)]."""
+    backup_root = config.get("backup_root")
+    units = []
+
+    if config.get("ppsspp_enabled"):
+        units.append(("PPSSPP", "PPSSPP_SAVES", backup_ppsspp, (config.get("ppsspp_path"), backup_root)))
+    if config.get("pcsx2_enabled"):
+        units.append(("PCSX2", "PCSX2_MEMCARDS", backup_pcsx2, (config.get("pcsx2_path"), backup_root)))
+    if config.get("citra_enabled"):
+        units.append(("CITRA", "CITRA_SDMC", backup_citra, (config.get("citra_path"), backup_root)))
+
+    for extra in extras:
+        if not extra.get("enabled", True):
+            continue
+        name = extra.get("name") or ""
+        units.append((name, name.replace(" ", "_"), backup_custom_dir, (extra, backup_root)))
+
+    return units
+
+
+def backup_jobs(config, extras):
+    """Lista de unidades de backup (função, args, kwargs) habilitadas no config."""
+    options = backup_options(config)
+    return [(func, args, options) for _, _, func, args in backup_units(config, extras)]
+
+
+def restore_units(config, extras):
+    """Unidades de restauração habilitadas: [(rótulo, prefixo, função, args)]."""
+    backup_root = config.get("backup_root")
+    units = []
+
+    if config.get("ppsspp_enabled"):
+        units.append(("PPSSPP", "PPSSPP_SAVES", restore_ppsspp, (config.get("ppsspp_path"), backup_root)))
+    if config.get("pcsx2_enabled"):
+        units.append(("PCSX2", "PCSX2_MEMCARDS", restore_pcsx2, (config.get("pcsx2_path"), backup_root)))
+    if config.get("citra_enabled"):
+        units.append(("CITRA", "CITRA_SDMC", restore_citra, (config.get("citra_path"), backup_root)))
+
+    for extra in extras:
+        if not extra.get("enabled", True):
+            continue
+        name = extra.get("name") or ""
+        units.append((name, name.replace(" ", "_"), restore_custom_dir, (extra, backup_root)))
+
+    return units
+
+
+def restore_jobs(config, extras):
+    """Lista de unidades de restauração (função, args, kwargs) habilitadas no config."""
+    options = restore_options(config)
+    return [(func, args, options) for _, _, func, args in restore_units(config, extras)]
+
+
+def prune_units(config, extras):
+    """
+    Política de retenção de cada unidade habilitada: [(rótulo, prefixo, política)].
+    Mesma regra do backup: a extra pode ter a sua, senão retention_units[prefixo],
+    senão retention.
+    """
+    default = config.get("retention")
+    per_unit = config.get("retention_units") or {}
+    extra_policies = {}
+    for extra in extras:
+        if extra.get("retention"):
+            extra_policies[(extra.get("name") or "").replace(" ", "_")] = extra["retention"]
+
+    units = []
+    for label, prefix, _, _ in restore_units(config, extras):
+        if prefix in extra_policies:
+            policy = extra_policies[prefix]
+        else:
+            policy = per_unit.get(prefix) or default
+        units.append((label, prefix, policy))
+    return units
+
+
+class ProgressTracker:
+    """
+    Junta o progresso de várias unidades num percentual único ponderado pelos
+    bytes de cada uma, com vazão (bytes/s) e ETA. Os avisos para a interface
+    são limitados a um a cada `interval` segundos (mensagens e conclusões de
+    unidade sempre passam).
+    """
+
+    def __init__(self, units, callback, interval=0.1):
+        self.callback = callback
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.percents = [0.0] * units
+        self.done = [0] * units
+        self.totals = [None] * units
+        self.started = time.monotonic()
+        self.last_emit = 0.0
+        self.overall = 0.0
+
+    def _snapshot(self, now):
+        known = [total for total in self.totals if total]
+        # Unidades que ainda não informaram bytes pesam como a média das outras
+        default_weight = sum(known) / len(known) if known else 1
+        weight_sum = 0.0
+        progress_sum = 0.0
+        for percent, done, total in zip(self.percents, self.done, self.totals):
+            if percent >= 100:
+                fraction = 1.0
+            elif total:
+                fraction = min(1.0, done / total)
+            else:
+                fraction = percent / 100
+            weight = total or default_weight
+            weight_sum += weight
+            progress_sum += weight * fraction
+
+        # Nunca volta para trás quando uma unidade grande entra na conta
+        self.overall = max(self.overall, 100 * progress_sum / weight_sum)
+
+        elapsed = now - self.started
+        rate = sum(self.done) / elapsed if elapsed > 0 else 0
+        eta = None
+        if rate > 0 and known:
+            eta = (weight_sum - progress_sum) / rate
+        return self.overall, rate, eta
+
+    def update(self, index, percent, message=None, done=None, total=None):
+        now = time.monotonic()
+        with self.lock:
+            self.percents[index] = percent
+            if total is not None:
+                self.totals[index] = total
+                self.done[index] = done or 0
+            force = message is not None or percent >= 100
+            if not force and now - self.last_emit < self.interval:
+                return
+            self.last_emit = now
+            overall, rate, eta = self._snapshot(now)
+        if self.callback:
+            self.callback(overall, message, rate=rate, eta=eta)
+
+
+def run_units(jobs, max_workers=DEFAULT_MAX_WORKERS, progress_callback=None):
+    """
+    Executa as unidades em paralelo (no máximo max_workers ao mesmo tempo).
+    Retorna a lista de (success, msg) na mesma ordem de jobs.
+    progress_callback(percent, message, rate=bytes/s, eta=segundos) recebe o
+    progresso geral, ponderado pelos bytes processados em todas as unidades.
+    """
+    if not jobs:
+        return []
+
+    tracker = ProgressTracker(len(jobs), progress_callback)
+
+    def unit_progress(index):
+        def progress(percent, message=None, done=None, total=None):
+            tracker.update(index, percent, message, done, total)
+        return progress
+
+    def run(index, func, args, kwargs):
+        try:
+            result = profile_call(func, *args, progress_callback=unit_progress(index), **kwargs)
+        except Exception as e:
+            result = (False, str(e))
+        # Unidades que falham ou são puladas também contam como concluídas
+        tracker.update(index, 100)
+        return result
+
+    workers = min(resolve_workers(max_workers), len(jobs))
+    if profiling():
+        # Um cProfile por vez (ver instrumentation.profile_call)
+        workers = 1
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="unit") as pool:
+        futures = [
+            pool.submit(run, index, func, args, kwargs)
+            for index, (func, args, kwargs) in enumerate(jobs)
+        ]
+        return [future.result() for future in futures]
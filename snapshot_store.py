@@ -0,0 +1,279 @@
+import os
+import json
+import zlib
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from archiver import iter_tree, group_of, is_selected, local_size
+from publish import publishing, write_atomic, is_partial, clean_stale_partials
+
+# ===================== REPOSITÓRIO DEDUPLICADO =====================
+# Os arquivos são divididos em blocos de tamanho fixo, identificados pelo
+# SHA-256 do conteúdo. Cada bloco é guardado uma única vez em
+# <pasta sincronizada>/.msb_store/chunks e cada backup vira um manifesto
+# pequeno (<prefixo>_<timestamp>.snapshot.json) que lista os blocos.
+
+STORE_DIR = ".msb_store"
+CHUNK_SIZE = 1024 * 1024
+SNAPSHOT_SUFFIX = ".snapshot.json"
+
+
+# Snapshots sendo gravados (acesso compartilhado) x coleta de lixo (exclusivo):
+# a coleta não pode apagar um bloco que um snapshot em andamento vai referenciar.
+_gc_cond = threading.Condition()
+_gc_state = {"writers": 0, "collecting": False}
+
+
+@contextmanager
+def _snapshot_writer():
+    with _gc_cond:
+        while _gc_state["collecting"]:
+            _gc_cond.wait()
+        _gc_state["writers"] += 1
+    try:
+        yield
+    finally:
+        with _gc_cond:
+            _gc_state["writers"] -= 1
+            _gc_cond.notify_all()
+
+
+@contextmanager
+def _garbage_collector():
+    with _gc_cond:
+        while _gc_state["collecting"] or _gc_state["writers"]:
+            _gc_cond.wait()
+        _gc_state["collecting"] = True
+    try:
+        yield
+    finally:
+        with _gc_cond:
+            _gc_state["collecting"] = False
+            _gc_cond.notify_all()
+
+
+def _chunks_dir(sync_dir):
+    return os.path.join(sync_dir, STORE_DIR, "chunks")
+
+
+def _chunk_path(sync_dir, digest):
+    return os.path.join(_chunks_dir(sync_dir), digest[:2], digest)
+
+
+def _is_chunk_name(name):
+    return len(name) == 64 and all(c in "0123456789abcdef" for c in name)
+
+
+def _write_atomic(path, data):
+    """Grava pelo caminho de publicação atômica (ver publish.py), criando a pasta."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atomic(path, data)
+
+
+def _store_chunk(sync_dir, block):
+    """Guarda o bloco se ainda não existir. Retorna (digest, bytes_novos)."""
+    digest = hashlib.sha256(block).hexdigest()
+    path = _chunk_path(sync_dir, digest)
+    if os.path.exists(path):
+        return digest, 0
+    data = zlib.compress(block, 6)
+    _write_atomic(path, data)
+    return digest, len(data)
+
+
+def _load_chunk(sync_dir, digest):
+    with open(_chunk_path(sync_dir, digest), "rb") as f:
+        block = zlib.decompress(f.read())
+    if hashlib.sha256(block).hexdigest() != digest:
+        raise ValueError(f"Corrupted chunk {digest}")
+    return block
+
+
+def create_snapshot(source_dir, sync_dir, manifest_path, progress_callback=None):
+    """
+    Guarda source_dir no repositório e escreve o manifesto em manifest_path.
+    Retorna (bytes novos gravados, tamanho do manifesto, sha256 do manifesto);
+    bytes novos é 0 se nada mudou.
+    progress_callback(bytes_feitos, bytes_totais) é chamado a cada bloco.
+    """
+    with _snapshot_writer():
+        return _create_snapshot(source_dir, sync_dir, manifest_path, progress_callback)
+
+
+def _create_snapshot(source_dir, sync_dir, manifest_path, progress_callback):
+    entries = [
+        (path, arcname, 0 if arcname.endswith("/") else os.path.getsize(path))
+        for path, arcname in iter_tree(source_dir)
+    ]
+    total = sum(size for _, _, size in entries)
+    done = 0
+    new_bytes = 0
+
+    files = []
+    for path, arcname, size in entries:
+        if arcname.endswith("/"):
+            files.append({"path": arcname})
+            continue
+
+        chunks = []
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(CHUNK_SIZE)
+                if not block:
+                    break
+                digest, written = _store_chunk(sync_dir, block)
+                chunks.append(digest)
+                new_bytes += written
+                done += len(block)
+                if progress_callback:
+                    progress_callback(done, total)
+
+        files.append({
+            "path": arcname,
+            "size": size,
+            "mtime": os.path.getmtime(path),
+            "chunks": chunks,
+        })
+
+    manifest = {
+        "version": 1,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "chunk_size": CHUNK_SIZE,
+        "files": files,
+    }
+    data = json.dumps(manifest, indent=1).encode("utf-8")
+    _write_atomic(manifest_path, data)
+    return new_bytes, len(data), hashlib.sha256(data).hexdigest()
+
+
+def list_snapshot_groups(manifest_path, depth=1):
+    """Entradas do snapshot agrupadas até `depth` níveis: [(entrada, bytes)]."""
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    sizes = {}
+    for entry in manifest.get("files", []):
+        group = group_of(entry["path"], depth)
+        sizes[group] = sizes.get(group, 0) + entry.get("size", 0)
+    return sorted(sizes.items())
+
+
+def _same_chunks(target, size, chunks, chunk_size):
+    """True se o arquivo local tem exatamente esses blocos (compara pelo SHA-256, sem ler o repositório)."""
+    if local_size(target) != size:
+        return False
+    with open(target, "rb") as f:
+        for digest in chunks:
+            if hashlib.sha256(f.read(chunk_size)).hexdigest() != digest:
+                return False
+    return True
+
+
+def restore_snapshot(manifest_path, sync_dir, dest_dir, progress_callback=None, members=None, stats=None):
+    """
+    Reconstrói dest_dir a partir do manifesto, conferindo o hash de cada bloco.
+    members limita a restauração a essas entradas (ver list_snapshot_groups).
+    stats (ExtractStats) pula os arquivos que já estão iguais no disco.
+    """
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    files = [entry for entry in manifest.get("files", []) if is_selected(entry["path"], members)]
+    total = sum(entry.get("size", 0) for entry in files)
+    done = 0
+    dest_root = os.path.abspath(dest_dir)
+
+    for entry in files:
+        target = os.path.abspath(os.path.join(dest_root, entry["path"]))
+        if os.path.commonpath([dest_root, target]) != dest_root:
+            raise ValueError(f"Invalid path in snapshot: {entry['path']}")
+
+        if entry["path"].endswith("/"):
+            os.makedirs(target, exist_ok=True)
+            continue
+
+        chunks = entry.get("chunks", [])
+        if stats and stats.compare and _same_chunks(target, entry.get("size", 0), chunks,
+                                                    manifest.get("chunk_size", CHUNK_SIZE)):
+            stats.add(entry.get("size", 0), written=False)
+            done += entry.get("size", 0)
+            if progress_callback:
+                progress_callback(done, total)
+            continue
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with publishing(target, durable=False) as out:
+            for digest in entry.get("chunks", []):
+                block = _load_chunk(sync_dir, digest)
+                out.write(block)
+                done += len(block)
+                if progress_callback:
+                    progress_callback(done, total)
+        if "mtime" in entry:
+            os.utime(target, (entry["mtime"], entry["mtime"]))
+        if stats:
+            stats.add(entry.get("size", 0), written=True)
+
+    return len(files)
+
+
+def verify_snapshot(manifest_path, sync_dir, checked=None):
+    """
+    Confere se todos os blocos do snapshot existem e batem com o hash.
+    checked (set) guarda os blocos já conferidos, que vários snapshots dividem.
+    Retorna a quantidade de arquivos; bloco ruim ou ausente levanta erro.
+    """
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    checked = set() if checked is None else checked
+
+    files = 0
+    for entry in manifest.get("files", []):
+        if entry["path"].endswith("/"):
+            continue
+        for digest in entry.get("chunks", []):
+            if digest not in checked:
+                _load_chunk(sync_dir, digest)
+                checked.add(digest)
+        files += 1
+    return files
+
+
+def collect_garbage(sync_dir, exclude=(), dry_run=False):
+    """
+    Apaga os blocos que nenhum manifesto da pasta referencia (chamar depois
+    de remover snapshots antigos). Manifestos em exclude são ignorados, para
+    simular a remoção no dry_run.
+    Retorna (quantidade, bytes) de blocos apagados, ou que seriam com dry_run.
+    """
+    with _garbage_collector():
+        # Listagem feita já com acesso exclusivo: nenhum snapshot novo pode surgir no meio
+        manifest_names = [
+            name for name in os.listdir(sync_dir)
+            if name.endswith(SNAPSHOT_SUFFIX) and name not in exclude
+        ]
+        referenced = set()
+        for name in manifest_names:
+            with open(os.path.join(sync_dir, name), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            for entry in manifest.get("files", []):
+                referenced.update(entry.get("chunks", []))
+
+        count = 0
+        reclaimed = 0
+        chunks_dir = _chunks_dir(sync_dir)
+        if not os.path.isdir(chunks_dir):
+            return 0, 0
+        for dirpath, dirnames, filenames in os.walk(chunks_dir):
+            if not dry_run and any(is_partial(name) for name in filenames):
+                clean_stale_partials(dirpath, _is_chunk_name)
+            for name in filenames:
+                if name.startswith(".") or name in referenced:
+                    continue
+                path = os.path.join(dirpath, name)
+                reclaimed += os.path.getsize(path)
+                count += 1
+                if not dry_run:
+                    os.remove(path)
+        return count, reclaimed
@@ -1,15 +1,46 @@
-import os
+import re
+from datetime import datetime
 
-def find_compressor():
-    """Localiza WinRAR ou 7-Zip no sistema"""
-    # WinRAR
-    rar = r"C:/Program Files/WinRAR/WinRAR.exe"
-    if os.path.exists(rar):
-        return "winrar", rar
+# Formato de data usado no nome de todos os backups
+TIMESTAMP_FORMAT = "%Y-%m-%d_%H-%M-%S"
 
-    # 7-Zip
-    seven = r"C:/Program Files/7-Zip/7z.exe"
-    if os.path.exists(seven):
-        return "7zip", seven
+# <prefixo>_<AAAA-MM-DD_HH-MM-SS><extensão>
+_BACKUP_NAME_RE = re.compile(
+    r"^(?P<prefix>.+)_(?P<timestamp>\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})"
+    r"(?P<ext>\.delta\.zip|\.zip|\.tar\.gz|\.tar\.xz|\.tar\.bz2|\.snapshot\.json)$"
+)
 
-    return None, None
+def backup_timestamp():
+    """Timestamp atual no formato usado nos nomes de backup"""
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
+
+def parse_backup_name(file_name):
+    """
+    Separa o nome de um backup em (prefixo, datetime, extensão).
+    Retorna None se o nome não seguir o padrão.
+    """
+    match = _BACKUP_NAME_RE.match(file_name)
+    if not match:
+        return None
+    try:
+        stamp = datetime.strptime(match.group("timestamp"), TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+    return match.group("prefix"), stamp, match.group("ext")
+
+def format_size(num_bytes):
+    """Tamanho legível (B, KB, MB, GB)"""
+    size = float(num_bytes)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+def format_eta(seconds):
+    """Tempo restante como m:ss ou h:mm:ss"""
+    seconds = max(0, int(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
@@ -0,0 +1,160 @@
+import os
+import json
+import mmap
+import tarfile
+import zlib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from archiver import new_hash, is_metadata, MANIFEST_MEMBER, EXTRACT_BUFFER
+from archive_formats import detect_format, FORMATS, ARCHIVE_ERRORS
+from snapshot_store import verify_snapshot, SNAPSHOT_SUFFIX
+from delta import DELTA_META, DELTA_SUFFIX
+
+# ===================== VERIFICAÇÃO DE INTEGRIDADE =====================
+# Lê cada backup da pasta sincronizada sem gravar nada no disco: no zip,
+# descompacta todos os membros (o zipfile confere o CRC-32 de cada um no fim
+# da leitura) e compara o BLAKE2b com o manifesto embutido; no tar.*, o
+# próprio gzip/xz/bzip2 confere os CRCs dos blocos. Zips grandes são lidos
+# por mmap (sem cópia para buffers de leitura) e vários backups são
+# conferidos ao mesmo tempo (zlib e hashlib liberam o GIL).
+# Backups anteriores ao manifesto são conferidos só pelo CRC.
+
+# Arquivos a partir desse tamanho são lidos por mmap
+MMAP_MIN_SIZE = 1024 * 1024
+
+
+class _MappedFile:
+    """Arquivo inteiro em mmap, com a interface de leitura que o zipfile usa."""
+
+    def __init__(self, f):
+        self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, size=-1):
+        return self.map.read(size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self.map.seek(offset, whence)
+
+    def tell(self):
+        return self.map.tell()
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        self.map.close()
+
+
+def _check_manifest(expected, found):
+    """Compara {nome: (tamanho, hash)} lido com o manifesto. Retorna quantos bateram."""
+    for name, entry in expected.items():
+        if name not in found:
+            raise ValueError(f"Missing member: {name}")
+        size, digest = found[name]
+        if size != entry["size"] or digest != entry["hash"]:
+            raise ValueError(f"Hash mismatch: {name}")
+    return len(expected)
+
+
+def _verify_zip(path):
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        view = _MappedFile(f) if size >= MMAP_MIN_SIZE else f
+        try:
+            with zipfile.ZipFile(view) as zf:
+                expected = {}
+                if MANIFEST_MEMBER in zf.NameToInfo:
+                    expected = json.loads(zf.read(MANIFEST_MEMBER))["files"]
+
+                found = {}
+                files = 0
+                for info in zf.infolist():
+                    if info.is_dir():
+                        continue
+                    digest = new_hash() if info.filename in expected else None
+                    # ZipExtFile levanta BadZipFile se o CRC-32 não bater
+                    with zf.open(info) as src:
+                        while True:
+                            chunk = src.read(EXTRACT_BUFFER)
+                            if not chunk:
+                                break
+                            if digest:
+                                digest.update(chunk)
+                    if digest:
+                        found[info.filename] = (info.file_size, digest.hexdigest())
+                    if not is_metadata(info.filename):
+                        files += 1
+
+                if path.endswith(DELTA_SUFFIX):
+                    base = json.loads(zf.read(DELTA_META)).get("base") or ""
+                    if not os.path.isfile(os.path.join(os.path.dirname(path), base)):
+                        raise ValueError(f"Base backup missing: {base}")
+                return files, _check_manifest(expected, found)
+        finally:
+            if view is not f:
+                view.close()
+
+
+def _verify_tar(path, fmt):
+    found = {}
+    manifest = None
+    files = 0
+    with open(path, "rb", buffering=EXTRACT_BUFFER) as raw, FORMATS[fmt]["open"](raw) as stream, \
+            tarfile.open(fileobj=stream, mode="r|") as tar:
+        for info in tar:
+            if not info.isfile():
+                continue
+            src = tar.extractfile(info)
+            if info.name == MANIFEST_MEMBER:
+                manifest = json.loads(src.read())
+            else:
+                digest = new_hash()
+                while True:
+                    chunk = src.read(EXTRACT_BUFFER)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                found[info.name] = (info.size, digest.hexdigest())
+                files += 1
+    expected = manifest["files"] if manifest else {}
+    return files, _check_manifest(expected, found)
+
+
+def verify_backup(sync_dir, backup_name, checked_chunks=None):
+    """
+    Confere um backup. Retorna (arquivos lidos, arquivos conferidos pelo
+    manifesto); corrompido, truncado ou incompleto levanta um de ARCHIVE_ERRORS
+    (ou zlib.error, num bloco do repositório).
+    """
+    path = os.path.join(sync_dir, backup_name)
+    if backup_name.endswith(SNAPSHOT_SUFFIX):
+        # No repositório cada bloco já é identificado pelo próprio hash
+        files = verify_snapshot(path, sync_dir, checked_chunks)
+        return files, files
+    fmt = detect_format(path)
+    if fmt == "zip":
+        return _verify_zip(path)
+    return _verify_tar(path, fmt)
+
+
+def verify_backups(sync_dir, backup_names, workers=None):
+    """
+    Confere vários backups ao mesmo tempo. Retorna, na ordem recebida,
+    [(nome, sucesso, (arquivos, conferidos) ou o erro)].
+    """
+    checked_chunks = set()
+
+    def check(name):
+        try:
+            return name, True, verify_backup(sync_dir, name, checked_chunks)
+        except (ARCHIVE_ERRORS + (zlib.error,)) as e:
+            return name, False, e
+        except KeyError as e:
+            return name, False, ValueError(f"Invalid manifest: {e}")
+
+    if not backup_names:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers or os.cpu_count() or 1, len(backup_names))),
+                            thread_name_prefix="verify") as pool:
+        return list(pool.map(check, backup_names))
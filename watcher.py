@@ -0,0 +1,255 @@
+import os
+import sys
+import time
+import errno
+import struct
+import select
+import threading
+
+from change_tracker import scan_tree
+
+# ===================== OBSERVADOR DE PASTAS =====================
+# Marca uma unidade como "suja" quando algo muda na pasta de saves dela e,
+# depois de quiet_seconds sem novas mudanças (o emulador costuma gravar um
+# save em várias escritas seguidas), avisa on_quiet(prefixos) só com as
+# unidades sujas. No Linux usa inotify (via ctypes, sem dependências) e não
+# gasta nada enquanto nada muda; nos outros sistemas, ou se o inotify
+# falhar, compara tamanho/mtime dos arquivos a cada poll_seconds.
+
+DEFAULT_QUIET_SECONDS = 30
+DEFAULT_POLL_SECONDS = 5
+
+
+def unit_folders(config, extras):
+    """Pastas observadas de cada unidade habilitada: {prefixo: pasta}."""
+    folders = {}
+    if config.get("ppsspp_enabled") and config.get("ppsspp_path"):
+        savedata = os.path.join(config["ppsspp_path"], "memstick", "PSP", "SAVEDATA")
+        if not os.path.isdir(savedata):
+            savedata = os.path.join(config["ppsspp_path"], "PSP", "SAVEDATA")
+        folders["PPSSPP_SAVES"] = savedata
+    if config.get("pcsx2_enabled") and config.get("pcsx2_path"):
+        folders["PCSX2_MEMCARDS"] = os.path.join(config["pcsx2_path"], "memcards")
+    if config.get("citra_enabled") and config.get("citra_path"):
+        folders["CITRA_SDMC"] = os.path.join(config["citra_path"], "sdmc")
+
+    for extra in extras:
+        if not extra.get("enabled", True) or not extra.get("name") or not extra.get("root_path"):
+            continue
+        folders[extra["name"].replace(" ", "_")] = extra["root_path"]
+
+    return {prefix: folder for prefix, folder in folders.items() if os.path.isdir(folder)}
+
+
+# ===================== INOTIFY (LINUX) =====================
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_EVENT = struct.Struct("iIII")
+
+
+class _InotifyBackend:
+    """Um watch por diretório (o inotify não é recursivo); pastas novas entram na hora."""
+
+    def __init__(self, folders):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._ctypes = ctypes
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.units = {}
+        try:
+            for prefix, folder in folders.items():
+                self._watch_tree(prefix, folder)
+        except OSError:
+            self.close()
+            raise
+
+    def _watch_tree(self, prefix, folder):
+        for dirpath, dirnames, filenames in os.walk(folder):
+            wd = self._add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd < 0:
+                err = self._ctypes.get_errno()
+                if err == errno.ENOENT:
+                    continue
+                # ENOSPC: limite max_user_watches atingido
+                raise OSError(err, os.strerror(err), dirpath)
+            self.units[wd] = (prefix, dirpath)
+
+    def wait(self, timeout):
+        """Espera eventos por até timeout segundos; retorna os prefixos que mudaram."""
+        try:
+            ready, _, _ = select.select([self.fd], [], [], timeout)
+        except InterruptedError:
+            return set()
+        if not ready:
+            return set()
+
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+                offset += _EVENT.size + length
+
+                if mask & IN_Q_OVERFLOW:
+                    # Eventos perdidos: não dá para saber quem mudou
+                    changed.update(prefix for prefix, _ in self.units.values())
+                    continue
+                unit = self.units.get(wd)
+                if unit is None:
+                    continue
+                prefix, dirpath = unit
+                if mask & IN_IGNORED:
+                    self.units.pop(wd, None)
+                    continue
+                changed.add(prefix)
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    try:
+                        self._watch_tree(prefix, os.path.join(dirpath, os.fsdecode(name)))
+                    except OSError:
+                        pass
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+# ===================== POLLING (QUALQUER SISTEMA) =====================
+
+class _PollingBackend:
+    """Compara tamanho/mtime de todos os arquivos a cada poll_seconds."""
+
+    def __init__(self, folders, poll_seconds):
+        self.folders = dict(folders)
+        self.poll_seconds = poll_seconds
+        self.states = {prefix: self._scan(folder) for prefix, folder in self.folders.items()}
+        self.next_scan = time.monotonic() + poll_seconds
+        self.closed = threading.Event()
+
+    @staticmethod
+    def _scan(folder):
+        try:
+            return scan_tree(folder)
+        except OSError:
+            return None
+
+    def wait(self, timeout):
+        delay = max(0.0, self.next_scan - time.monotonic())
+        if delay > timeout:
+            self.closed.wait(timeout)
+            return set()
+        if self.closed.wait(delay):
+            return set()
+        self.next_scan = time.monotonic() + self.poll_seconds
+
+        changed = set()
+        for prefix, folder in self.folders.items():
+            state = self._scan(folder)
+            if state != self.states[prefix]:
+                self.states[prefix] = state
+                changed.add(prefix)
+        return changed
+
+    def close(self):
+        self.closed.set()
+
+
+# ===================== OBSERVADOR =====================
+
+class Watcher:
+    """
+    Observa as pastas numa thread própria. on_quiet(prefixos) é chamado
+    quando unidades sujas ficam quiet_seconds sem mudanças.
+    """
+
+    def __init__(self, folders, on_quiet, quiet_seconds=DEFAULT_QUIET_SECONDS,
+                 poll_seconds=DEFAULT_POLL_SECONDS, use_inotify=None):
+        self.folders = dict(folders)
+        self.on_quiet = on_quiet
+        self.quiet_seconds = quiet_seconds
+        self.poll_seconds = poll_seconds
+        self.use_inotify = sys.platform.startswith("linux") if use_inotify is None else use_inotify
+        self.dirty = {}
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.backend = None
+
+    def _open_backend(self):
+        if self.use_inotify:
+            try:
+                return _InotifyBackend(self.folders)
+            except (OSError, AttributeError):
+                # Sem libc/inotify ou sem watches livres: cai para o polling
+                pass
+        return _PollingBackend(self.folders, self.poll_seconds)
+
+    @property
+    def backend_name(self):
+        return "inotify" if isinstance(self.backend, _InotifyBackend) else "polling"
+
+    def start(self):
+        self.backend = self._open_backend()
+        self.thread = threading.Thread(target=self._loop, name="watcher", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+        if self.backend:
+            self.backend.close()
+
+    def dirty_units(self):
+        with self.lock:
+            return set(self.dirty)
+
+    def _loop(self):
+        while not self.stopping.is_set():
+            with self.lock:
+                oldest = min(self.dirty.values(), default=None)
+            # Acorda a tempo de ver a unidade suja mais antiga ficar quieta
+            timeout = self.quiet_seconds if oldest is None else max(0.05, oldest + self.quiet_seconds - time.monotonic())
+            changed = self.backend.wait(min(timeout, 1.0))
+
+            now = time.monotonic()
+            with self.lock:
+                for prefix in changed:
+                    # Cada nova escrita adia o backup (debounce)
+                    self.dirty[prefix] = now
+                quiet = {prefix for prefix, last in self.dirty.items() if now - last >= self.quiet_seconds}
+                for prefix in quiet:
+                    del self.dirty[prefix]
+
+            if quiet:
+                self.on_quiet(quiet)